@@ -1,36 +1,73 @@
+import asyncio
 import logging
 import os
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 from typing import Any
 
 from telethon import TelegramClient, events
-from googletrans import Translator
 
 from dotenv import load_dotenv
 from telethon.errors import UserNotParticipantError
 from telethon.tl.functions.channels import GetParticipantRequest
 
+from ext.aggregator import MessageAggregator
+from ext.catch_up import CatchUp, Checkpoints
+from ext.chunking import TextChunker
+from ext.diagnostics import (
+    LoopMonitor,
+    Profiler,
+    executor_stats,
+    memory_stats,
+    tasks_stats,
+)
+from ext.entity_cache import EntityCache
+from ext.group_config import GroupConfig, GroupConfigStore
+from ext.inline_queries import InlineQueries
 from ext.local_translated import LocalTranslated
+from ext.logs import setup_logging
+from ext.reply_index import ReplyIndex
+from ext.resilience import CircuitOpenError, ResilientTranslator
+from ext.scheduler import ChatScheduler
 from ext.sessions import Sessions, Category
-from ext.language_detection import LanguageDetection
+from ext.startup import StartupTimer
+from ext.language_detection import (
+    DetectedLanguage,
+    LangDetectBackend,
+    LanguageDetection,
+)
+from ext.language_profiles import LanguageProfiles
+from ext.message_filter import MessageFilter
+from ext.metrics import metrics
+from ext.outbox import Outbox, Priority
+from ext.translation_batcher import TranslationBatcher
+from ext.translation_cache import TranslationCache
+from ext.translators import create_translator
 from utils import get_version
 
-logging.basicConfig(
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s", level=logging.INFO
+load_dotenv()
+
+setup_logging(
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
+    level=logging.INFO,
+    dedup_interval=float(os.environ.get("LOG_DEDUP_INTERVAL", 60)),
 )
 
 logger = logging.getLogger("bot")
 logging.getLogger("telethon").setLevel(logging.WARNING)
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-load_dotenv()
+startup = StartupTimer()
 
 # Your API credentials (Get from https://my.telegram.org)
 api_id = int(os.environ.get("API_ID", 0))
 api_hash = os.environ.get("API_HASH")
 bot_token = os.environ.get("BOT_TOKEN")
 assert api_id and api_hash and bot_token, "API credentials not found"
-groups_id = list(map(int, os.environ.get("GROUPS_ID", "0").strip().split(",")))
+groups_id = [
+    int(g) for g in os.environ.get("GROUPS_ID", "0").strip().split(",") if g.strip()
+]
 from_users = os.environ.get("FROM_USERS", [])
 if isinstance(from_users, str):
     from_users = [u.strip() for u in from_users.strip().split(",") if u.strip()]
@@ -53,22 +90,329 @@ excluded_languages.append(destination_language)
 trust_telegram_language = (
     os.environ.get("TRUST_TELEGRAM_LANGUAGE", "true").strip().lower() == "true"
 )
+target_excluded_languages = {
+    target.strip(): [u.strip() for u in languages.split(",") if u.strip()]
+    for target, _, languages in (
+        rule.partition(":")
+        for rule in os.environ.get("TARGET_EXCLUDED_LANGUAGES", "").split(";")
+        if rule.strip()
+    )
+}
+
+
+def get_target_excluded_languages(target: str) -> list[str]:
+    if target == destination_language:
+        return excluded_languages
+    if target in target_excluded_languages:
+        return target_excluded_languages[target] + [target]
+    return [u for u in excluded_languages if u != destination_language] + [target]
+
+
+group_targets = {
+    int(chat_id): {
+        target.strip(): get_target_excluded_languages(target.strip())
+        for target in targets.split(",")
+        if target.strip()
+    }
+    for chat_id, _, targets in (
+        rule.partition(":")
+        for rule in os.environ.get("GROUP_DESTINATION_LANGUAGES", "").split(";")
+        if rule.strip()
+    )
+}
+admin_users = [
+    u.strip() for u in os.environ.get("ADMIN_USERS", "").strip().split(",") if u.strip()
+]
+groups_config_watch_interval = float(os.environ.get("GROUPS_CONFIG_WATCH_INTERVAL", 10))
+translation_cache_size = int(os.environ.get("TRANSLATION_CACHE_SIZE", 10000))
+translation_cache_ttl = int(os.environ.get("TRANSLATION_CACHE_TTL", 7 * 24 * 3600))
+translator_backend = os.environ.get("TRANSLATOR_BACKEND", "google").strip().lower()
+translator_options = {
+    "libre": {
+        "url": os.environ.get("LIBRETRANSLATE_URL", "http://localhost:5000"),
+        "api_key": os.environ.get("LIBRETRANSLATE_API_KEY") or None,
+        "timeout": float(os.environ.get("TRANSLATOR_TIMEOUT", 10)),
+    },
+    "fake": {
+        "latency": float(os.environ.get("FAKE_TRANSLATOR_LATENCY", 0)),
+        "failure_rate": float(os.environ.get("FAKE_TRANSLATOR_FAILURE_RATE", 0)),
+    },
+}.get(translator_backend, {})
+translator_rate = float(os.environ.get("TRANSLATOR_RATE", 5))
+translator_retries = int(os.environ.get("TRANSLATOR_RETRIES", 2))
+translator_failure_threshold = int(os.environ.get("TRANSLATOR_FAILURE_THRESHOLD", 5))
+translator_recovery_time = float(os.environ.get("TRANSLATOR_RECOVERY_TIME", 30))
+translator_hedge_after = int(os.environ.get("TRANSLATOR_HEDGE_AFTER_MS", 0))
+translation_batch_window = int(os.environ.get("TRANSLATION_BATCH_WINDOW_MS", 50))
+translation_batch_size = int(os.environ.get("TRANSLATION_BATCH_SIZE", 20))
+outbox_global_rate = float(os.environ.get("OUTBOX_GLOBAL_RATE", 30))
+outbox_chat_rate = float(os.environ.get("OUTBOX_CHAT_RATE", 1))
+outbox_group_rate = float(os.environ.get("OUTBOX_GROUP_RATE_PER_MINUTE", 20)) / 60
+merge_replies = os.environ.get("MERGE_REPLIES", "False").strip().lower() == "true"
+use_language_profiles = (
+    os.environ.get("USE_LANGUAGE_PROFILES", "True").strip().lower() == "true"
+)
+language_profiles_size = int(os.environ.get("LANGUAGE_PROFILES_SIZE", 50000))
+language_profile_confidence = float(os.environ.get("LANGUAGE_PROFILE_CONFIDENCE", 0.9))
+language_profile_sample_every = int(os.environ.get("LANGUAGE_PROFILE_SAMPLE_EVERY", 10))
+language_profile_half_life = float(
+    os.environ.get("LANGUAGE_PROFILE_HALF_LIFE", 7 * 24 * 3600)
+)
+catch_up_policy = os.environ.get("CATCH_UP_POLICY", "reply").strip().lower()
+catch_up_max_age = float(os.environ.get("CATCH_UP_MAX_AGE", 3600))
+catch_up_limit = int(os.environ.get("CATCH_UP_LIMIT", 500))
+catch_up_concurrency = int(os.environ.get("CATCH_UP_CONCURRENCY", 4))
+inline_languages = [
+    lang.strip()
+    for lang in os.environ.get(
+        "INLINE_LANGUAGES", ",".join(dict.fromkeys([destination_language, "en"]))
+    ).split(",")
+    if lang.strip()
+]
+inline_debounce = int(os.environ.get("INLINE_DEBOUNCE_MS", 500))
+inline_cache_time = int(os.environ.get("INLINE_CACHE_TIME", 300))
+profile_max_seconds = float(os.environ.get("PROFILE_MAX_SECONDS", 60))
+chunk_max_length = int(os.environ.get("CHUNK_MAX_LENGTH", 1000))
+chunk_concurrency = int(os.environ.get("CHUNK_CONCURRENCY", 4))
+language_detection_cache_size = int(
+    os.environ.get("LANGUAGE_DETECTION_CACHE_SIZE", 4096)
+)
+min_text_length = int(os.environ.get("MIN_TEXT_LENGTH", 3))
+min_text_words = int(os.environ.get("MIN_TEXT_WORDS", 1))
+min_letters_ratio = float(os.environ.get("MIN_LETTERS_RATIO", 0.3))
+sessions_backend = os.environ.get("SESSIONS_BACKEND", "journal").strip().lower()
+sessions_flush_interval = float(os.environ.get("SESSIONS_FLUSH_INTERVAL", 1.0))
+sessions_compact_threshold = int(os.environ.get("SESSIONS_COMPACT_THRESHOLD", 1000))
+sessions_fsync = os.environ.get("SESSIONS_FSYNC", "True").strip().lower() == "true"
+entity_cache_ttl = float(os.environ.get("ENTITY_CACHE_TTL", 600))
+membership_cache_ttl = float(os.environ.get("MEMBERSHIP_CACHE_TTL", 300))
+membership_negative_ttl = float(os.environ.get("MEMBERSHIP_NEGATIVE_TTL", 30))
+max_concurrency = int(os.environ.get("MAX_CONCURRENCY", 32))
+max_chat_concurrency = int(os.environ.get("MAX_CHAT_CONCURRENCY", 1))
+max_chat_queue = int(os.environ.get("MAX_CHAT_QUEUE", 100))
+queue_policy = os.environ.get("QUEUE_POLICY", "drop_oldest").strip().lower()
+detection_workers = int(os.environ.get("DETECTION_WORKERS", 2))
+detection_processes = int(os.environ.get("DETECTION_PROCESSES", 0))
+shard_count = int(os.environ.get("SHARD_COUNT", 1))
+shard_index = int(os.environ.get("SHARD_INDEX", 0))
+sessions_watch_interval = float(os.environ.get("SESSIONS_WATCH_INTERVAL", 5))
+aggregation_quiet_period = float(os.environ.get("AGGREGATION_QUIET_PERIOD", 0))
+aggregation_max_messages = int(os.environ.get("AGGREGATION_MAX_MESSAGES", 10))
+use_edit_translation = (
+    os.environ.get("USE_EDIT_TRANSLATION", "True").strip().lower() == "true"
+)
+reply_index_size = int(os.environ.get("REPLY_INDEX_SIZE", 10000))
+reply_index_persistent = (
+    os.environ.get("REPLY_INDEX_PERSISTENT", "True").strip().lower() == "true"
+)
+metrics_host = os.environ.get("METRICS_HOST", "127.0.0.1")
+metrics_port = int(os.environ.get("METRICS_PORT", 0))
+metrics_log_interval = float(os.environ.get("METRICS_LOG_INTERVAL", 0))
+use_script_detection = (
+    os.environ.get("USE_SCRIPT_DETECTION", "true").strip().lower() == "true"
+)
 
 if debug:
     logger.setLevel(logging.DEBUG)
 
-language_detection = LanguageDetection(destination_language, excluded_languages)
-sessions = Sessions(storage_path)
-translator = Translator()
-local_translated = LocalTranslated(translator, destination_language)
+metrics.enabled = bool(metrics_port or metrics_log_interval)
+events_received = metrics.counter("events_received_total", "Received group messages")
+messages_filtered = metrics.counter(
+    "messages_filtered_total", "Messages skipped before translation"
+)
+detection_seconds = metrics.histogram("detection_seconds", "Language detection latency")
+detection_backend = LangDetectBackend()
+detection_executor = (
+    ProcessPoolExecutor(
+        max_workers=detection_processes, initializer=detection_backend.warmup
+    )
+    if detection_processes > 0
+    else ThreadPoolExecutor(
+        max_workers=detection_workers, thread_name_prefix="detection"
+    )
+)
+language_detection = LanguageDetection(
+    destination_language,
+    excluded_languages,
+    backend=detection_backend,
+    pre_filter=None if use_script_detection else False,
+    cache_size=language_detection_cache_size,
+    executor=detection_executor,
+)
+aggregator = (
+    MessageAggregator(
+        lambda burst: submit_burst(burst),
+        quiet_period=aggregation_quiet_period,
+        max_messages=aggregation_max_messages,
+    )
+    if aggregation_quiet_period > 0
+    else None
+)
+reply_index = ReplyIndex(
+    storage_path, max_entries=reply_index_size, persistent=reply_index_persistent
+)
+scheduler = ChatScheduler(
+    max_concurrency=max_concurrency,
+    per_chat_concurrency=max_chat_concurrency,
+    max_queue=max_chat_queue,
+    policy=queue_policy,
+)
+default_group_config = GroupConfig(
+    {destination_language: excluded_languages},
+    trust_telegram_language=trust_telegram_language,
+)
+group_configs = GroupConfigStore(
+    default_group_config,
+    get_target_excluded_languages,
+    groups={
+        chat_id: GroupConfig(
+            group_targets.get(chat_id, default_group_config.targets),
+            trust_telegram_language=trust_telegram_language,
+        )
+        for chat_id in dict.fromkeys([*groups_id, *group_targets])
+        if chat_id
+    },
+    restricted=any(groups_id),
+    storage_path=storage_path,
+)
+language_profiles = (
+    LanguageProfiles(
+        storage_path,
+        max_entries=language_profiles_size,
+        min_confidence=language_profile_confidence,
+        sample_every=language_profile_sample_every,
+        half_life=language_profile_half_life,
+    )
+    if use_language_profiles
+    else None
+)
+text_chunker = TextChunker(chunk_max_length, chunk_concurrency)
+message_filter = MessageFilter(min_text_length, min_text_words, min_letters_ratio)
+sessions_options = (
+    {
+        "flush_interval": sessions_flush_interval,
+        "compact_threshold": sessions_compact_threshold,
+        "fsync": sessions_fsync,
+    }
+    if sessions_backend == "journal"
+    else {}
+)
+sessions = Sessions(storage_path, backend=sessions_backend, **sessions_options)
+translator_upstream = create_translator(translator_backend, **translator_options)
+translator = ResilientTranslator(
+    translator_upstream,
+    rate=translator_rate,
+    retries=translator_retries,
+    failure_threshold=translator_failure_threshold,
+    recovery_time=translator_recovery_time,
+    hedge_after=translator_hedge_after / 1000,
+)
+if translation_batch_window > 0:
+    translator = TranslationBatcher(
+        translator,
+        window=translation_batch_window / 1000,
+        max_batch=translation_batch_size,
+        batches=translator_upstream.batches,
+    )
+translation_cache = TranslationCache(
+    storage_path, max_entries=translation_cache_size, ttl=translation_cache_ttl
+)
+entity_cache = EntityCache(ttl=entity_cache_ttl)
+membership_cache = EntityCache(
+    ttl=membership_cache_ttl,
+    negative_ttl=membership_negative_ttl,
+    negative_exceptions=(UserNotParticipantError, IndexError),
+)
+ui_strings = [
+    "You must specify a group ID or join a group to use this command.",
+    "I've sent the answer to you privately. Check your personal messages from this bot! This notification will only be shown to you once.",
+    "You must be a member of the group to use this command. Please join the group and try again.",
+    "According to Telegram app's language settings, you are always excluded from automatic translation for this language",
+    "You must join a group to use this command.",
+    "Help with commands",
+    "Translate to desired language of entered text",
+    "Translate in any chat without sending commands",
+    " Show ",
+    "of this group",
+    " Exclude current user from automatic translations",
+    " Include current user for automatic translations",
+    " Check if included current user for automatic translations",
+    "Unknown group.",
+    "You are excluded for using the bot in group: ",
+    "You are included for using the bot in group: ",
+    "You have been excluded from using the bot in group",
+    "You have been included for using the bot in group",
+    "Missing text to translate.",
+    "In translation from",
+]
+loop_monitor = LoopMonitor()
+profiler = Profiler(max_seconds=profile_max_seconds)
+inline_queries = InlineQueries(
+    lambda text, dest: translation_cache.translate(translator, text, dest=dest),
+    lambda text: language_detection.detect_language(text),
+    inline_languages,
+    debounce=inline_debounce / 1000,
+)
+local_translated = LocalTranslated(
+    translator, destination_language, catalog=ui_strings, storage_path=storage_path
+)
 
 client = TelegramClient(
-    storage_path / ".bot",
+    storage_path / (f".bot-{shard_index}" if shard_count > 1 else ".bot"),
     api_id,
     api_hash,
     lang_code=destination_language,
     use_ipv6=use_ipv6,
-).start(bot_token=bot_token)
+)
+outbox = Outbox(
+    client,
+    global_rate=outbox_global_rate,
+    chat_rate=outbox_chat_rate,
+    group_rate=outbox_group_rate,
+    merge=merge_replies,
+)
+checkpoints = Checkpoints(
+    storage_path,
+    f".checkpoints-{shard_index}.json" if shard_count > 1 else ".checkpoints.json",
+)
+catch_up = CatchUp(
+    client,
+    checkpoints,
+    process=lambda event: translate_missed(event),
+    reply=lambda event, text: reply_translation(event, text, priority=Priority.BACKLOG),
+    send=lambda chat_id, text: outbox.send_message(
+        chat_id, text, priority=Priority.BACKLOG
+    ),
+    policy=catch_up_policy,
+    max_age=catch_up_max_age,
+    max_messages=catch_up_limit,
+    concurrency=catch_up_concurrency,
+    is_busy=lambda: scheduler.queued > 0,
+    from_users=from_users,
+)
+
+
+def is_my_shard(chat_id: int | None) -> bool:
+    if shard_count <= 1:
+        return True
+    if chat_id is None or chat_id > 0:
+        # private chats are served by the first worker
+        return shard_index == 0
+    if chat_id in groups_id:
+        return groups_id.index(chat_id) % shard_count == shard_index
+    return abs(chat_id) % shard_count == shard_index
+
+
+def in_shard(event) -> bool:
+    return is_my_shard(event.chat_id)
+
+
+async def is_admin(event) -> bool:
+    sender = await event.get_sender()
+    username = f"@{sender.username}" if sender and sender.username else None
+    return str(event.sender_id) in admin_users or (
+        username is not None and username in admin_users
+    )
 
 
 def get_sender_language(event) -> str:
@@ -91,33 +435,42 @@ async def get_chat_id_from_arg(event) -> int | None:
     arg_1 = args[0] if len(args) > 0 else None
     chat_id = int(arg_1) if arg_1 else event.chat_id
     if not arg_1 and not event.is_group:
-        await event.reply(
+        await outbox.reply(
+            event,
             await local_translated.gettext(
                 "You must specify a group ID or join a group to use this command.",
                 get_sender_language(event),
-            )
+            ),
         )
         return None
     return chat_id
 
 
-def extract_text_from_message(message):
+def extract_poll_parts(message) -> list[tuple[str, str]] | None:
+    # question and answers are translated separately, answers repeat across polls
     if message.media:
         try:
             if poll := message.media.poll:
-                question = poll.question.text
-                answer = ", ".join([str(answer.text.text) for answer in poll.answers])
-                return f"{question}: {answer}"
+                parts = [(poll.question.text, ": ")]
+                parts.extend((str(answer.text.text), ", ") for answer in poll.answers)
+                parts[-1] = (parts[-1][0], "")
+                return parts
         except Exception as e:
             logger.error(e)
+    return None
+
+
+def extract_text_from_message(message):
+    if parts := extract_poll_parts(message):
+        return "".join(text + separator for text, separator in parts)
     return message.message
 
 
 async def send_intro_message():
     try:
         for entity in groups_id:
-            if entity:
-                await client.send_message(
+            if entity and is_my_shard(entity):
+                await outbox.send_message(
                     entity, "🚀 Bot started and ready to translate in this group!"
                 )
     except Exception as e:
@@ -130,16 +483,18 @@ async def answer_private_message(
     try:
         chat_id = chat_id or event.chat_id
         sender_id = sender_id or event.sender_id
+        await sessions.wait_loaded()
         if sessions.is_exists(Category.INFORMED, chat_id, sender_id):
             return
         await sessions.add(Category.INFORMED, chat_id, sender_id)
         group_name = await get_group_name(chat_id=chat_id)
         if group_name:
-            await event.reply(
+            await outbox.reply(
+                event,
                 await local_translated.gettext(
                     "I've sent the answer to you privately. Check your personal messages from this bot! This notification will only be shown to you once.",
                     get_sender_language(event),
-                )
+                ),
             )
     except Exception as e:
         logger.error(e)
@@ -150,21 +505,25 @@ async def is_sender_in_group(event, chat_id: int | None = None):
     if event and chat_id:
         try:
             # Fetch the participant information
-            await client(
-                GetParticipantRequest(
-                    channel=chat_id,
-                    participant=event.sender_id,
-                )
+            await membership_cache.get(
+                (chat_id, event.sender_id),
+                lambda: client(
+                    GetParticipantRequest(
+                        channel=chat_id,
+                        participant=event.sender_id,
+                    )
+                ),
             )
             # logger.debug(f"User {event.sender_id} is a member of the group.")
             return True
         except (UserNotParticipantError, IndexError):
             logger.debug(f"User {event.sender_id} is NOT a member of the group.")
-            await event.reply(
+            await outbox.reply(
+                event,
                 await local_translated.gettext(
                     "You must be a member of the group to use this command. Please join the group and try again.",
                     get_sender_language(event),
-                )
+                ),
             )
         except Exception as e:
             logger.error(e)
@@ -174,7 +533,7 @@ async def is_sender_in_group(event, chat_id: int | None = None):
 async def get_group_name(event=None, chat_id: str | int | None = None) -> str | None:
     try:
         chat_id = int(chat_id) if chat_id is not None else event.chat_id
-        entity = await client.get_entity(chat_id)
+        entity = await entity_cache.get(chat_id, lambda: client.get_entity(chat_id))
         group_name = entity.title if entity and hasattr(entity, "title") else None
         return group_name
     except Exception as e:
@@ -183,13 +542,15 @@ async def get_group_name(event=None, chat_id: str | int | None = None) -> str |
 
 async def is_trusted_telegram_language(event, notify: bool = True) -> bool | None:
     sender_language = get_sender_language(event)
+    group_config = group_configs.get(event.chat_id)
+    destination_language = group_config.destination_language
     if (
-        trust_telegram_language
+        group_config.trust_telegram_language
         and sender_language
         and sender_language == destination_language
     ):
         if notify:
-            await client.send_message(
+            await outbox.send_message(
                 event.sender_id,
                 await local_translated.gettext(
                     "According to Telegram app's language settings, you are always excluded from automatic translation for this language",
@@ -203,26 +564,44 @@ async def is_trusted_telegram_language(event, notify: bool = True) -> bool | Non
         return True
 
 
-@client.on(events.NewMessage(pattern=r"^/chat_id"))
+@client.on(events.ChatAction(func=in_shard))
+async def handler_chat_action(event):
+    try:
+        if event.new_title or event.new_photo:
+            entity_cache.invalidate(event.chat_id)
+        if (
+            event.user_joined
+            or event.user_added
+            or event.user_left
+            or event.user_kicked
+        ):
+            for user_id in event.user_ids or []:
+                membership_cache.invalidate((event.chat_id, user_id))
+    except Exception as e:
+        logger.error(e)
+
+
+@client.on(events.NewMessage(pattern=r"^/chat_id", func=in_shard))
 async def handler_chat_id(event):
     if not event.is_group:
-        await event.reply(
+        await outbox.reply(
+            event,
             await local_translated.gettext(
                 "You must join a group to use this command.", get_sender_language(event)
-            )
+            ),
         )
         return None
     chat_id = int(event.chat_id)
     sender_id = event.sender_id
     group_name = await get_group_name(chat_id=chat_id)
     try:
-        await client.send_message(sender_id, f"Group ID: {chat_id} of '{group_name}'")
+        await outbox.send_message(sender_id, f"Group ID: {chat_id} of '{group_name}'")
         await answer_private_message(event, chat_id, sender_id)
     except Exception as e:
         logger.error(e)
 
 
-@client.on(events.NewMessage(pattern=r"^/help"))
+@client.on(events.NewMessage(pattern=r"^/help", func=in_shard))
 async def handler_help(event):
     try:
         src = get_sender_language(event)
@@ -232,6 +611,10 @@ async def handler_help(event):
             + await local_translated.gettext(
                 "Translate to desired language of entered text", src
             ),
+            "@bot <lang> <text> - "
+            + await local_translated.gettext(
+                "Translate in any chat without sending commands", src
+            ),
             "/chat_id - "
             + await local_translated.gettext(" Show ", src)
             + " chat_id "
@@ -252,12 +635,12 @@ async def handler_help(event):
             "__Version: {version}__".format(version=__version__),
         ]
 
-        await event.reply("\n".join(help_text))
+        await outbox.reply(event, "\n".join(help_text))
     except Exception as e:
         logger.error(e)
 
 
-@client.on(events.NewMessage(pattern=r"^/check\s?([-0-9]*)"))
+@client.on(events.NewMessage(pattern=r"^/check\s?([-0-9]*)", func=in_shard))
 async def handler_check(event):
     try:
         chat_id = await get_chat_id_from_arg(event)
@@ -266,16 +649,20 @@ async def handler_check(event):
         if not await is_sender_in_group(event, chat_id=chat_id):
             return None
         sender_id = event.sender_id
+        await sessions.wait_loaded()
         excluded = sessions.is_exists(Category.EXCLUDED_SENDERS, chat_id, sender_id)
         group_name = await get_group_name(chat_id=chat_id)
         if not group_name:
-            await event.reply(
-                local_translated.gettext("Unknown group.", get_sender_language(event))
+            await outbox.reply(
+                event,
+                await local_translated.gettext(
+                    "Unknown group.", get_sender_language(event)
+                ),
             )
             return None
         if await is_trusted_telegram_language(event):
             return
-        await client.send_message(
+        await outbox.send_message(
             sender_id,
             await local_translated.gettext(
                 f"You are {'excluded' if excluded else 'included'} for using the bot in group: ",
@@ -288,7 +675,7 @@ async def handler_check(event):
         logger.error(e)
 
 
-@client.on(events.NewMessage(pattern=r"^/exclude\s?([-0-9]*)"))
+@client.on(events.NewMessage(pattern=r"^/exclude\s?([-0-9]*)", func=in_shard))
 async def handler_exclude(event):
     try:
         chat_id = await get_chat_id_from_arg(event)
@@ -301,14 +688,15 @@ async def handler_exclude(event):
             return
         group_name = await get_group_name(chat_id=chat_id)
         if not group_name:
-            await event.reply(
+            await outbox.reply(
+                event,
                 await local_translated.gettext(
                     "Unknown group.", get_sender_language(event)
-                )
+                ),
             )
             return None
         await sessions.add(Category.EXCLUDED_SENDERS, chat_id, event.sender_id)
-        await client.send_message(
+        await outbox.send_message(
             sender_id,
             await local_translated.gettext(
                 f"You have been excluded from using the bot in group",
@@ -321,7 +709,7 @@ async def handler_exclude(event):
         logger.error(e)
 
 
-@client.on(events.NewMessage(pattern=r"^/include\s?([-0-9]*)"))
+@client.on(events.NewMessage(pattern=r"^/include\s?([-0-9]*)", func=in_shard))
 async def handler_include(event):
     try:
         chat_id = await get_chat_id_from_arg(event)
@@ -337,7 +725,7 @@ async def handler_include(event):
             await local_translated.gettext("Unknown group.", get_sender_language(event))
             return None
         await sessions.remove(Category.EXCLUDED_SENDERS, chat_id, event.sender_id)
-        await client.send_message(
+        await outbox.send_message(
             sender_id,
             await local_translated.gettext(
                 f"You have been included for using the bot in group",
@@ -350,10 +738,107 @@ async def handler_include(event):
         logger.error(e)
 
 
-@client.on(events.NewMessage(pattern=r"^/translate(?:\s+(\S+)(?:\s+(.+))?)?$"))
+@client.on(events.InlineQuery(func=in_shard))
+async def handler_inline(event):
+    try:
+        results = await inline_queries.resolve(event.sender_id, event.text)
+        if results is None:
+            return None
+        builder = event.builder
+        articles = [
+            await builder.article(
+                f"({language_detection.map_lang(result.src)}) → {result.dest}",
+                description=result.text[:100],
+                text=result.text,
+                id=f"{result.dest}",
+            )
+            for result in results
+        ]
+        await event.answer(articles, cache_time=inline_cache_time)
+    except Exception as e:
+        logger.error(e)
+
+
+def collect_stats() -> dict[str, dict]:
+    return {
+        "loop_lag": loop_monitor.stats,
+        "tasks": tasks_stats(),
+        "default_executor": executor_stats(
+            getattr(asyncio.get_running_loop(), "_default_executor", None)
+        ),
+        "detection_executor": executor_stats(detection_executor),
+        "memory": memory_stats(),
+        "scheduler": scheduler.stats,
+        "outbox": outbox.stats,
+        "translation_cache": translation_cache.stats,
+        "ui_strings": {
+            lang: len(translations)
+            for lang, translations in local_translated.t_cache.items()
+        },
+        "sessions": {
+            str(category): sum(len(values) for values in groups.values())
+            for category, groups in sessions.sessions.items()
+        },
+        "entity_cache": entity_cache.stats,
+        "membership_cache": membership_cache.stats,
+        "detection_cache": {"entries": len(language_detection.cache)},
+        "reply_index": {"entries": len(reply_index)},
+        "language_profiles": (
+            language_profiles.stats if language_profiles is not None else {}
+        ),
+        "inline_queries": inline_queries.stats,
+        "message_filter": message_filter.stats,
+    }
+
+
+@client.on(events.NewMessage(pattern=r"^/stats", func=in_shard))
+async def handler_stats(event):
+    try:
+        if not await is_admin(event):
+            return None
+        lines = [
+            f"{name}: " + ", ".join(f"{key}={value}" for key, value in section.items())
+            for name, section in collect_stats().items()
+        ]
+        await outbox.reply(event, "\n".join(lines))
+    except Exception as e:
+        logger.error(e)
+
+
+@client.on(events.NewMessage(pattern=r"^/profile\s?([0-9.]*)", func=in_shard))
+async def handler_profile(event):
+    try:
+        if not await is_admin(event):
+            return None
+        seconds = float(event.pattern_match.group(1) or 5)
+        summary = await profiler.profile(seconds)
+        await outbox.reply(event, f"```\n{summary[:4000]}\n```")
+    except Exception as e:
+        logger.error(e)
+
+
+@client.on(events.NewMessage(pattern=r"^/reload", func=in_shard))
+async def handler_reload(event):
+    try:
+        if not await is_admin(event):
+            return None
+        if await group_configs.reload():
+            await outbox.reply(
+                event, f"Configuration of {len(group_configs.groups)} groups reloaded."
+            )
+        else:
+            await outbox.reply(event, "Configuration reload failed, see logs.")
+    except Exception as e:
+        logger.error(e)
+
+
+@client.on(
+    events.NewMessage(pattern=r"^/translate(?:\s+(\S+)(?:\s+(.+))?)?$", func=in_shard)
+)
 async def translate_handler(event):
     try:
         args = get_command_args(event)
+        destination_language = group_configs.get(event.chat_id).destination_language
         if len(args) == 2:
             target_lang = args[0]
             if len(target_lang) == 2 and target_lang.islower():
@@ -365,87 +850,380 @@ async def translate_handler(event):
             target_lang = destination_language
             text = args[0]
         else:
-            await event.reply(
+            await outbox.reply(
+                event,
                 await local_translated.gettext(
                     "Missing text to translate.", get_sender_language(event)
-                )
+                ),
             )
             return
 
-        translated = await translator.translate(text, dest=target_lang)
-        await event.reply(
+        translated = await text_chunker.translate(
+            [(text, "")],
+            partial(translation_cache.translate, translator, dest=target_lang),
+        )
+        await outbox.reply(
+            event,
             "".join(
                 [
                     "",
                     await local_translated.gettext(
                         "In translation from", get_sender_language(event)
                     ),
-                    f" ({language_detection.map_lang(target_lang)}):\n{translated.text}",
+                    f" ({language_detection.map_lang(target_lang)}):\n{translated}",
                 ]
-            )
+            ),
         )
     except Exception as e:
         try:
-            await event.reply(f"Translation failed: {e}")
+            await outbox.reply(event, f"Translation failed: {e}")
         except Exception as e:
             logger.error(e)
 
 
+async def detect_sender_languages(event, text: str) -> list[DetectedLanguage]:
+    chat_id, sender_id = event.chat_id, event.sender_id
+    if language_profiles is not None and sender_id:
+        if lang := language_profiles.predict(chat_id, sender_id):
+            checked = language_detection.check_script(text, lang)
+            if checked:
+                return [DetectedLanguage(lang, 1.0)]
+            if checked is False:
+                logger.debug(f"Sender '{sender_id}' doesn't write in '{lang}' now")
+                language_profiles.reset(chat_id, sender_id)
+    with detection_seconds.time():
+        detected_languages = await language_detection.detect_languages(text)
+    if language_profiles is not None and sender_id and detected_languages:
+        language_profiles.observe(
+            chat_id, sender_id, detected_languages[0].lang, detected_languages[0].prob
+        )
+    return detected_languages
+
+
+async def translate_message(event, original_text: str = None) -> str | None:
+    parts = None
+    if original_text is None:
+        original_text = extract_text_from_message(event.message)
+        parts = extract_poll_parts(event.message)
+    group_config = group_configs.get(event.chat_id)
+    if rule := message_filter.classify(original_text, group_config.min_text_length):
+        messages_filtered.inc(reason=rule)
+        return None
+    targets = group_config.targets
+    sender_language = get_sender_language(event)
+    if group_config.trust_telegram_language and sender_language in targets:
+        # the sender reads this language, other targets are still translated
+        logger.debug(f"Sender language '{sender_language}' is trusted.")
+        targets = {k: v for k, v in targets.items() if k != sender_language}
+        if not targets:
+            messages_filtered.inc(reason="trusted_language")
+            return None
+    detected_languages = await detect_sender_languages(
+        event, message_filter.strip(original_text)
+    )
+    # detection runs once, every target language applies its own rules
+    targets = language_detection.select_targets(
+        detected_languages,
+        targets,
+        group_config.probability_threshold,
+    )
+    if not targets:
+        messages_filtered.inc(reason="excluded_language")
+        return None
+    results = await asyncio.gather(
+        *[
+            text_chunker.translate(
+                parts or [(original_text, "")],
+                partial(translation_cache.translate, translator, dest=target),
+            )
+            for target in targets
+        ],
+        return_exceptions=True,
+    )
+    translations = {
+        target: result
+        for target, result in zip(targets, results)
+        if not isinstance(result, BaseException)
+    }
+    if not translations:
+        if any(isinstance(result, CircuitOpenError) for result in results):
+            logger.debug("Translation service is unavailable, translation skipped.")
+            messages_filtered.inc(reason="circuit_open")
+            return None
+        raise results[0]
+    logger.debug(f"translation_cache={translation_cache.stats}")
+    detected_language = targets[next(iter(translations))]
+    header = "".join(
+        [
+            await local_translated.gettext(
+                "In translation from", get_sender_language(event)
+            ),
+            f" ({language_detection.map_lang(detected_language)}):\n",
+        ]
+    )
+    if len(targets) == 1:
+        return header + next(iter(translations.values()))
+    return header + "\n\n".join(
+        f"[{target}] {translated_text}"
+        for target, translated_text in translations.items()
+    )
+
+
+async def should_translate(event) -> bool:
+    group_config = group_configs.get(event.chat_id)
+    if not group_config.enabled or not group_configs.is_allowed(event.chat_id):
+        messages_filtered.inc(reason="disabled_group")
+        return False
+    await sessions.wait_loaded()
+    if sessions.is_exists(Category.EXCLUDED_SENDERS, event.chat_id, event.sender_id):
+        logger.debug(f"Sender '{event.sender_id}' is excluded from translation.")
+        messages_filtered.inc(reason="excluded_sender")
+        return False
+    return True
+
+
+async def reply_translation(
+    event,
+    text: str,
+    indexed: bool = True,
+    priority: Priority = Priority.TRANSLATION,
+):
+    if merge_replies and not (use_edit_translation and indexed):
+        # merged replies can't be edited, so only sent when edits are not tracked
+        await outbox.reply(event, text, priority=priority, mergeable=True, wait=False)
+        return
+    reply = await outbox.reply(event, text, priority=priority)
+    if use_edit_translation and indexed and reply:
+        await reply_index.set(
+            event.chat_id, event.id, reply.id, extract_text_from_message(event.message)
+        )
+
+
+async def edit_translation(event, reply_id: int, text: str):
+    await outbox.edit_message(event.chat_id, reply_id, text)
+    await reply_index.set(
+        event.chat_id, event.id, reply_id, extract_text_from_message(event.message)
+    )
+
+
 # @client.on(events.NewMessage)
 async def handler(event):
     try:
         if event.raw_text.startswith("/"):
             return
-        if sessions.is_exists(
-            Category.EXCLUDED_SENDERS, event.chat_id, event.sender_id
-        ):
-            logger.debug(f"Sender '{event.sender_id}' is excluded from translation.")
+        events_received.inc()
+        checkpoints.update(event.chat_id, event.id)
+        if not await should_translate(event):
             return
-        if await is_trusted_telegram_language(event, notify=False):
+        if aggregator:
+            aggregator.add(event, extract_text_from_message(event.message))
             return
-        original_text = extract_text_from_message(event.message)
-        detected_language = await language_detection.detect_language(original_text)
-        if detected_language not in excluded_languages:
-            translated_text = await translator.translate(
-                original_text, dest=destination_language
-            )
-            await event.reply(
-                "".join(
-                    [
-                        await local_translated.gettext(
-                            "In translation from", get_sender_language(event)
-                        ),
-                        f" ({language_detection.map_lang(detected_language)}):\n{translated_text.text}",
-                    ]
-                )
-            )
+        scheduler.submit(
+            event.chat_id,
+            lambda: translate_message(event),
+            lambda text: reply_translation(event, text),
+        )
+    except Exception as e:
+        logger.error(e)
+
 
+async def translate_missed(event) -> str | None:
+    text = extract_text_from_message(event.message)
+    if not text or text.startswith("/"):
+        return None
+    if not await should_translate(event):
+        return None
+    return await translate_message(event)
+
+
+async def run_catch_up():
+    chat_ids = [
+        chat_id
+        for chat_id in checkpoints.loaded
+        if is_my_shard(chat_id)
+        and group_configs.is_allowed(chat_id)
+        and group_configs.get(chat_id).enabled
+    ]
+    await startup.run("catch_up", catch_up.run(chat_ids))
+
+
+def submit_burst(burst: list):
+    if len(burst) == 1:
+        # a single message keeps its poll parts and can be edited later
+        event = burst[0]
+        scheduler.submit(
+            event.chat_id,
+            lambda: translate_message(event),
+            lambda text: reply_translation(event, text),
+        )
+        return
+    texts = [extract_text_from_message(event.message) for event in burst]
+    original_text = "\n".join(text for text in texts if text)
+    last_event = burst[-1]
+    scheduler.submit(
+        last_event.chat_id,
+        lambda: translate_message(last_event, original_text),
+        lambda text: reply_translation(last_event, text, indexed=False),
+    )
+
+
+# @client.on(events.MessageEdited)
+async def edit_handler(event):
+    try:
+        if event.raw_text.startswith("/"):
+            return
+        entry = reply_index.get(event.chat_id, event.id)
+        if entry is None:
+            return
+        text = extract_text_from_message(event.message)
+        if not reply_index.is_changed(event.chat_id, event.id, text):
+            logger.debug(f"Message {event.id} is edited without text changes.")
+            return
+        if not await should_translate(event):
+            return
+        reply_id = entry[0]
+        scheduler.submit(
+            event.chat_id,
+            lambda: translate_message(event),
+            lambda translated: edit_translation(event, reply_id, translated),
+        )
     except Exception as e:
         logger.error(e)
 
 
-async def main():
+def register_gauges():
+    metrics.gauge(
+        "translation_cache_hit_ratio",
+        "Hit ratio of the translation cache",
+        lambda: translation_cache.stats["hit_ratio"],
+    )
+    metrics.gauge(
+        "ui_strings_cache_hit_ratio",
+        "Hit ratio of translated UI strings",
+        lambda: round(
+            local_translated.hits
+            / max(1, local_translated.hits + local_translated.misses),
+            3,
+        ),
+    )
+    metrics.gauge(
+        "detection_executor_queue",
+        "Detections waiting for a worker",
+        lambda: executor_stats(detection_executor)["queued"],
+    )
+    metrics.gauge(
+        "event_loop_lag_seconds",
+        "Delay of the event loop",
+        lambda: loop_monitor.last,
+    )
+    metrics.gauge(
+        "scheduler_queue", "Messages waiting for translation", lambda: scheduler.queued
+    )
+    metrics.gauge(
+        "scheduler_chat_queue",
+        "Messages waiting for translation per chat",
+        scheduler.queue_depths,
+    )
+    metrics.gauge(
+        "scheduler_running", "Messages being translated", lambda: scheduler.running
+    )
+    metrics.gauge(
+        "scheduler_dropped",
+        "Messages dropped because of full queue",
+        lambda: scheduler.dropped,
+    )
+
+
+async def start_metrics():
+    if not metrics.enabled:
+        return
+    register_gauges()
+    if metrics_port:
+        await metrics.serve(metrics_host, metrics_port + shard_index)
+    if metrics_log_interval:
+        asyncio.create_task(metrics.log_summary(metrics_log_interval))
+
+
+async def warmup():
+    # heavy initialization runs after the client already receives events
+    stages = [
+        startup.run("sessions", sessions.load_async()),
+        startup.run_in_thread("groups_config", group_configs.load),
+        startup.run("translation_cache", translation_cache.load_async()),
+        startup.run("reply_index", reply_index.load_async()),
+        startup.run_in_thread("language_detection", language_detection.warmup),
+        warmup_ui_strings(),
+        startup.run("checkpoints", checkpoints.load_async()),
+    ]
+    if language_profiles is not None:
+        stages.append(startup.run("language_profiles", language_profiles.load_async()))
+    await asyncio.gather(*stages)
+    startup.mark("ready")
+    logger.info(f"Startup: {startup.report()}")
     if use_intro_message:
         await send_intro_message()
-    logger.info("Starting bot...")
-    options = {"incoming": True, "pattern": r"^(?!/).*"}
+    if catch_up_policy != "skip":
+        asyncio.create_task(run_catch_up())
+
+
+async def warmup_ui_strings():
+    await startup.run("locales", local_translated.load_async())
+    await startup.run("ui_strings", local_translated.warmup())
+
+
+async def main():
+    startup.mark("main")
+    options = {"incoming": True, "pattern": r"^(?!/).*", "func": in_shard}
     if from_users:
         options["from_users"] = from_users
-    if groups_id:
-        options["chats"] = groups_id
+    # handlers are registered before connecting, so no update is missed
     client.add_event_handler(handler, events.NewMessage(**options))
-    await client.run_until_disconnected()
+    if use_edit_translation:
+        client.add_event_handler(edit_handler, events.MessageEdited(**options))
+    logger.info("Starting bot...")
+    try:
+        await startup.run("connect", client.start(bot_token=bot_token))
+        startup.mark("receiving_events")
+        await start_metrics()
+        asyncio.create_task(loop_monitor.run())
+        asyncio.create_task(warmup())
+        if language_profiles is not None:
+            asyncio.create_task(language_profiles.autosave())
+        asyncio.create_task(checkpoints.autosave())
+        if groups_config_watch_interval > 0:
+            asyncio.create_task(group_configs.watch(groups_config_watch_interval))
+        if shard_count > 1:
+            logger.info(f"Worker {shard_index + 1} of {shard_count}")
+            asyncio.create_task(sessions.watch(sessions_watch_interval))
+        await client.run_until_disconnected()
+    finally:
+        await translator.close()
+        await client.disconnect()
 
 
 if __name__ == "__main__":
     __version__: str | Any = os.environ.get("VERSION", get_version())
     logger.debug(f"Version: {__version__}")
-    sessions.load()
     logger.debug(f"{excluded_languages=}")
     logger.debug(f"{trust_telegram_language=}")
 
     try:
-        with client:
-            client.loop.run_until_complete(main())
+        client.loop.run_until_complete(main())
     except KeyboardInterrupt:
         client.disconnect()
+    finally:
+        logger.info(f"Translation cache: {translation_cache.stats}")
+        logger.info(f"Message filter: {message_filter.stats}")
+        logger.info(f"Scheduler: {scheduler.stats}")
+        logger.info(f"Text chunker: {text_chunker.stats}")
+        logger.info(f"Outbox: {outbox.stats}")
+        if language_profiles is not None:
+            logger.info(f"Language profiles: {language_profiles.stats}")
+            language_profiles.close()
+        logger.info(f"Catch-up: {catch_up.stats}")
+        logger.info(f"Inline queries: {inline_queries.stats}")
+        outbox.close()
+        checkpoints.close()
+        translation_cache.close()
+        sessions.close()
+        reply_index.close()
@@ -0,0 +1,67 @@
+import asyncio
+import logging
+from typing import Any, Callable
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class Burst:
+    __slots__ = ("sender_id", "events", "length", "timer")
+
+    def __init__(self, sender_id: int):
+        self.sender_id = sender_id
+        self.events: list = []
+        self.length = 0
+        self.timer: asyncio.TimerHandle | None = None
+
+
+class MessageAggregator:
+    def __init__(
+        self,
+        on_burst: Callable[[list], Any],
+        quiet_period: float = 3.0,
+        max_messages: int = 10,
+        max_length: int = 2000,
+    ):
+        self.on_burst = on_burst
+        self.quiet_period = quiet_period
+        self.max_messages = max_messages
+        self.max_length = max_length
+        # one burst per chat: only consecutive messages of a sender are joined
+        self.bursts: dict[int, Burst] = {}
+        self.aggregated = 0
+
+    def add(self, event, text: str | None) -> None:
+        chat_id = event.chat_id
+        burst = self.bursts.get(chat_id)
+        if burst is not None and burst.sender_id != event.sender_id:
+            self.flush(chat_id)
+            burst = None
+        if burst is None:
+            burst = self.bursts[chat_id] = Burst(event.sender_id)
+        burst.events.append(event)
+        burst.length += len(text or "")
+        if burst.timer:
+            burst.timer.cancel()
+        if len(burst.events) >= self.max_messages or burst.length >= self.max_length:
+            self.flush(chat_id)
+        else:
+            burst.timer = asyncio.get_running_loop().call_later(
+                self.quiet_period, self.flush, chat_id
+            )
+
+    def flush(self, chat_id: int) -> None:
+        burst = self.bursts.pop(chat_id, None)
+        if burst is None:
+            return
+        if burst.timer:
+            burst.timer.cancel()
+        self.aggregated += len(burst.events) - 1
+        try:
+            self.on_burst(burst.events)
+        except Exception as e:
+            logger.error(e)
+
+    def flush_all(self) -> None:
+        for chat_id in list(self.bursts):
+            self.flush(chat_id)
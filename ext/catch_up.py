@@ -0,0 +1,298 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+missed_messages = metrics.counter(
+    "missed_messages_total", "Messages received while the bot was offline"
+)
+
+
+class Checkpoints:
+    def __init__(self, storage_path: Path = None, checkpoints_filename: str = None):
+        self.storage_path = storage_path or Path(__file__).parent.parent.joinpath(
+            "storage"
+        )
+        self.checkpoints_path = self.storage_path / (
+            checkpoints_filename or ".checkpoints.json"
+        )
+        # chat_id -> id of the last processed message
+        self.checkpoints: dict[int, int] = {}
+        # checkpoints of the previous run, where the catch-up starts
+        self.loaded: dict[int, int] = {}
+        # chat_id -> first message received live, where the catch-up stops
+        self.first_live: dict[int, int] = {}
+        self.changed = False
+
+    def get(self, chat_id: int) -> int | None:
+        return self.checkpoints.get(chat_id)
+
+    def update(self, chat_id: int, message_id: int, live: bool = True) -> None:
+        if live:
+            self.first_live.setdefault(chat_id, message_id)
+        if message_id > self.checkpoints.get(chat_id, 0):
+            self.checkpoints[chat_id] = message_id
+            self.changed = True
+
+    def _load(self) -> dict[int, int] | None:
+        try:
+            if not self.checkpoints_path.exists():
+                return {}
+            with self.checkpoints_path.open("r", encoding="utf-8") as f:
+                return {int(k): v for k, v in json.load(f).items()}
+        except Exception as e:
+            logger.error(e)
+
+    def _merge(self, loaded: dict[int, int] | None) -> None:
+        if loaded is None:
+            return
+        self.loaded = loaded
+        # ids received live meanwhile are newer and stay
+        for chat_id, message_id in loaded.items():
+            self.update(chat_id, message_id, live=False)
+        logger.debug(f"Loaded checkpoints of {len(self.loaded)} chats")
+
+    def load(self) -> None:
+        self._merge(self._load())
+
+    async def load_async(self) -> None:
+        self._merge(await asyncio.to_thread(self._load))
+
+    def _save(self, checkpoints: dict[int, int]) -> None:
+        tmp_path = self.checkpoints_path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(checkpoints, f)
+        os.replace(tmp_path, self.checkpoints_path)
+
+    async def save(self) -> None:
+        if not self.changed:
+            return
+        self.changed = False
+        try:
+            await asyncio.to_thread(self._save, dict(self.checkpoints))
+        except Exception as e:
+            self.changed = True
+            logger.error(f"Error during checkpoints save: {e}")
+
+    async def autosave(self, interval: float = 10):
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    def close(self) -> None:
+        if self.changed:
+            try:
+                self._save(dict(self.checkpoints))
+            except Exception as e:
+                logger.error(f"Error during checkpoints save: {e}")
+
+
+class MissedMessage:
+    # looks like a NewMessage event to the translation pipeline
+    def __init__(self, message):
+        self.message = message
+
+    def __getattr__(self, name):
+        return getattr(self.message, name)
+
+
+class CatchUp:
+    policies = ("reply", "digest", "skip")
+    # ids requested at once, the limit of messages.getMessages
+    page_size = 100
+
+    def __init__(
+        self,
+        client,
+        checkpoints: Checkpoints,
+        process: Callable[[Any], Awaitable[str | None]],
+        reply: Callable[[Any, str], Awaitable[Any]],
+        send: Callable[[int, str], Awaitable[Any]],
+        policy: str = "reply",
+        max_age: float = 3600,
+        max_messages: int = 500,
+        concurrency: int = 4,
+        is_busy: Callable[[], bool] = None,
+        max_length: int = 4096,
+        from_users: list = None,
+    ):
+        if policy not in self.policies:
+            raise ValueError(f"Unknown catch-up policy: {policy}")
+        self.client = client
+        self.checkpoints = checkpoints
+        self.process = process
+        self.reply = reply
+        self.send = send
+        self.policy = policy
+        self.max_age = max_age
+        self.max_messages = max_messages
+        self.concurrency = concurrency
+        self.is_busy = is_busy
+        self.max_length = max_length
+        # the same limit as the live handler has, resolved to ids on the first run
+        self.from_users = from_users
+        self.sender_ids: set[int] | None = None
+        self.missed = 0
+        self.translated = 0
+        self.skipped = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "missed": self.missed,
+            "translated": self.translated,
+            "skipped": self.skipped,
+        }
+
+    def _accept(self, message) -> bool:
+        self.missed += 1
+        missed_messages.inc()
+        if message.out or (
+            self.sender_ids is not None and message.sender_id not in self.sender_ids
+        ):
+            self.skipped += 1
+            return False
+        return True
+
+    async def _get_page(self, chat_id: int, ids: range) -> list:
+        # bots can't read the history, but may get messages by their ids
+        messages = await self.client.get_messages(chat_id, ids=list(ids))
+        return [message for message in messages if message is not None]
+
+    async def _fetch_newest(
+        self, chat_id: int, last_id: int, first_live: int, min_date
+    ) -> list:
+        # goes back from the first live message, so the newest ones are kept
+        messages = []
+        high = first_live
+        while high > last_id + 1 and len(messages) < self.max_messages:
+            low = max(last_id + 1, high - self.page_size)
+            page = await self._get_page(chat_id, range(low, high))
+            high = low
+            for message in reversed(page):
+                if min_date and message.date < min_date:
+                    return messages[::-1]
+                if self._accept(message):
+                    messages.append(message)
+                    if len(messages) >= self.max_messages:
+                        break
+        return messages[::-1]
+
+    async def _fetch_forward(self, chat_id: int, last_id: int, min_date) -> list:
+        # nothing was received live yet, so the chat is read until an empty page
+        messages = deque(maxlen=self.max_messages)
+        low = last_id + 1
+        while page := await self._get_page(chat_id, range(low, low + self.page_size)):
+            low += self.page_size
+            first_live = self.checkpoints.first_live.get(chat_id)
+            for message in page:
+                if first_live is not None and message.id >= first_live:
+                    return list(messages)
+                if min_date and message.date < min_date:
+                    self.missed += 1
+                    self.skipped += 1
+                    continue
+                if self._accept(message):
+                    if len(messages) == messages.maxlen:
+                        self.skipped += 1
+                    messages.append(message)
+        return list(messages)
+
+    async def fetch(self, chat_id: int) -> list[MissedMessage]:
+        last_id = self.checkpoints.loaded.get(chat_id)
+        if last_id is None:
+            return []
+        min_date = (
+            datetime.now(timezone.utc) - timedelta(seconds=self.max_age)
+            if self.max_age
+            else None
+        )
+        first_live = self.checkpoints.first_live.get(chat_id)
+        if first_live is None:
+            messages = await self._fetch_forward(chat_id, last_id, min_date)
+        else:
+            messages = await self._fetch_newest(chat_id, last_id, first_live, min_date)
+        return [MissedMessage(message) for message in messages]
+
+    async def _process(self, event, semaphore: asyncio.Semaphore) -> str | None:
+        async with semaphore:
+            # live messages go first, the backlog waits while they are queued
+            while self.is_busy and self.is_busy():
+                await asyncio.sleep(0.1)
+            try:
+                return await self.process(event)
+            except Exception as e:
+                logger.error(e)
+            finally:
+                self.checkpoints.update(event.chat_id, event.id, live=False)
+
+    def digest(self, translations: list[str]) -> list[str]:
+        texts, current = [], ""
+        for translated in translations:
+            if current and len(current) + len(translated) + 2 > self.max_length:
+                texts.append(current)
+                current = ""
+            current = f"{current}\n\n{translated}" if current else translated
+        if current:
+            texts.append(current)
+        return texts
+
+    async def run_chat(self, chat_id: int) -> None:
+        try:
+            events = await self.fetch(chat_id)
+        except Exception as e:
+            logger.error(f"Catch-up of chat {chat_id} failed: {e}")
+            return
+        if not events:
+            return
+        logger.info(f"Catching up {len(events)} missed messages in chat {chat_id}")
+        if self.policy == "skip":
+            self.skipped += len(events)
+            self.checkpoints.update(chat_id, events[-1].id, live=False)
+            return
+        semaphore = asyncio.Semaphore(self.concurrency)
+        results = await asyncio.gather(
+            *[self._process(event, semaphore) for event in events]
+        )
+        translated = [
+            (event, text) for event, text in zip(events, results) if text is not None
+        ]
+        self.translated += len(translated)
+        if self.policy == "reply":
+            for event, text in translated:
+                try:
+                    await self.reply(event, text)
+                except Exception as e:
+                    logger.error(e)
+        elif translated:
+            for text in self.digest([text for _, text in translated]):
+                try:
+                    await self.send(chat_id, text)
+                except Exception as e:
+                    logger.error(e)
+
+    async def resolve_senders(self) -> None:
+        if not self.from_users or self.sender_ids is not None:
+            return
+        self.sender_ids = {
+            await self.client.get_peer_id(user) for user in self.from_users
+        }
+
+    async def run(self, chat_ids: list[int]) -> None:
+        try:
+            await self.resolve_senders()
+        except Exception as e:
+            # without the senders every missed message would be translated
+            logger.error(f"Catch-up skipped, senders not resolved: {e}")
+            return
+        # chats are caught up one by one, messages of a chat concurrently
+        for chat_id in chat_ids:
+            await self.run_chat(chat_id)
+        logger.info(f"Catch-up finished: {self.stats}")
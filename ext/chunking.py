@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import re
+from typing import Awaitable, Callable
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+
+translation_chunks = metrics.counter(
+    "translation_chunks_total", "Chunks of long texts translated separately"
+)
+
+
+class TextChunker:
+    # from the largest to the smallest boundary, separators are kept
+    boundaries = [
+        re.compile(r"(\n\s*\n)"),
+        re.compile(r"(\n)"),
+        re.compile(r"((?<=[.!?…;])\s+)"),
+        re.compile(r"(\s+)"),
+    ]
+
+    def __init__(self, max_length: int = 1000, max_concurrency: int = 4):
+        self.max_length = max_length
+        self.max_concurrency = max_concurrency
+        self.chunked = 0
+        self.chunks = 0
+
+    @property
+    def stats(self) -> dict:
+        return {"chunked": self.chunked, "chunks": self.chunks}
+
+    def _split(self, text: str, level: int = 0) -> list[tuple[str, str]]:
+        if len(text) <= self.max_length:
+            return [(text, "")]
+        if level == len(self.boundaries):
+            return [
+                (text[i : i + self.max_length], "")
+                for i in range(0, len(text), self.max_length)
+            ]
+        parts = self.boundaries[level].split(text)
+        segments = []
+        for i in range(0, len(parts), 2):
+            separator = parts[i + 1] if i + 1 < len(parts) else ""
+            sub_segments = self._split(parts[i], level + 1)
+            last, last_separator = sub_segments[-1]
+            sub_segments[-1] = (last, last_separator + separator)
+            segments.extend(sub_segments)
+        return segments
+
+    def split(self, text: str) -> list[tuple[str, str]]:
+        # returns chunks with the separators that follow them
+        chunks = []
+        for segment, separator in self._split(text or ""):
+            if chunks:
+                previous, previous_separator = chunks[-1]
+                joined = previous + previous_separator + segment
+                if len(joined) <= self.max_length:
+                    chunks[-1] = (joined, separator)
+                    continue
+            chunks.append((segment, separator))
+        return chunks
+
+    async def translate(
+        self,
+        parts: list[tuple[str, str]],
+        translate: Callable[[str], Awaitable[str]],
+    ) -> str:
+        # parts are texts translated separately (e.g. poll options) with separators
+        chunks = []
+        for text, separator in parts:
+            sub_chunks = self.split(text)
+            last, last_separator = sub_chunks[-1]
+            sub_chunks[-1] = (last, last_separator + separator)
+            chunks.extend(sub_chunks)
+        if len(chunks) > 1:
+            self.chunked += 1
+            self.chunks += len(chunks)
+            translation_chunks.inc(len(chunks))
+            logger.debug(f"Text translated in {len(chunks)} chunks")
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def translate_chunk(chunk: str) -> str:
+            if not chunk.strip():
+                return chunk
+            async with semaphore:
+                return await translate(chunk)
+
+        results = await asyncio.gather(*[translate_chunk(chunk) for chunk, _ in chunks])
+        return "".join(
+            translated + separator
+            for translated, (_, separator) in zip(results, chunks)
+        )
@@ -0,0 +1,104 @@
+import asyncio
+import cProfile
+import io
+import logging
+import os
+import pstats
+import resource
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class LoopMonitor:
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.total = 0.0
+        self.samples = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "last_ms": round(self.last * 1000, 2),
+            "avg_ms": round(self.total / max(1, self.samples) * 1000, 2),
+            "max_ms": round(self.max * 1000, 2),
+        }
+
+    async def run(self):
+        # a busy loop wakes up the sleeping monitor late, the delay is the lag
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.last = max(0.0, time.perf_counter() - started - self.interval)
+            self.max = max(self.max, self.last)
+            self.total += self.last
+            self.samples += 1
+
+
+def executor_stats(executor: Executor | None) -> dict:
+    if isinstance(executor, ThreadPoolExecutor):
+        return {
+            "workers": len(executor._threads),
+            "max_workers": executor._max_workers,
+            "queued": executor._work_queue.qsize(),
+        }
+    if isinstance(executor, ProcessPoolExecutor):
+        return {
+            "workers": len(executor._processes or {}),
+            "max_workers": executor._max_workers,
+            "queued": len(executor._pending_work_items),
+        }
+    return {}
+
+
+def tasks_stats() -> dict:
+    tasks = asyncio.all_tasks()
+    names = {}
+    for task in tasks:
+        coro = task.get_coro()
+        name = getattr(coro, "__qualname__", type(coro).__name__)
+        names[name] = names.get(name, 0) + 1
+    top = sorted(names.items(), key=lambda x: x[1], reverse=True)[:5]
+    return {"total": len(tasks), **dict(top)}
+
+
+def memory_stats() -> dict:
+    # ru_maxrss is in KiB on Linux
+    stats = {
+        "peak_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        stats["rss_mb"] = round(pages * os.sysconf("SC_PAGE_SIZE") / 1024**2, 1)
+    except (OSError, ValueError):
+        pass
+    return stats
+
+
+class Profiler:
+    def __init__(self, max_seconds: float = 60, top: int = 25):
+        self.max_seconds = max_seconds
+        self.top = top
+        self.locker = asyncio.Lock()
+
+    async def profile(self, seconds: float) -> str:
+        # profiles the event loop thread, handlers keep running meanwhile
+        seconds = min(max(seconds, 0.1), self.max_seconds)
+        if self.locker.locked():
+            return "Profiling is already running."
+        async with self.locker:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                profiler.disable()
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        logger.debug(f"Profiled the event loop for {seconds}s")
+        return output.getvalue()
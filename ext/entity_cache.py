@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class EntityCache:
+    def __init__(
+        self,
+        ttl: float = 600,
+        negative_ttl: float = 60,
+        max_entries: int = 4096,
+        negative_exceptions: tuple[type[Exception], ...] = (),
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.negative_exceptions = negative_exceptions
+        # key -> (expires, value, exception)
+        self.entries: OrderedDict[Hashable, tuple[float, Any, Exception | None]] = (
+            OrderedDict()
+        )
+        self.in_flight: dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def stats(self) -> dict:
+        return {"entries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    def _lookup(self, key: Hashable):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def _store(self, key: Hashable, ttl: float, value, exception=None) -> None:
+        if ttl <= 0:
+            return
+        self.entries[key] = (time.monotonic() + ttl, value, exception)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        entry = self._lookup(key)
+        if entry is not None:
+            self.hits += 1
+            if entry[2] is not None:
+                raise entry[2]
+            return entry[1]
+        self.misses += 1
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._load(key, loader))
+            self.in_flight[key] = future
+        return await asyncio.shield(future)
+
+    async def _load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]):
+        try:
+            value = await loader()
+            self._store(key, self.ttl, value)
+            return value
+        except self.negative_exceptions as e:
+            self._store(key, self.negative_ttl, None, e)
+            raise
+        finally:
+            self.in_flight.pop(key, None)
+
+    def invalidate(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
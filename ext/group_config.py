@@ -0,0 +1,144 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class GroupConfig:
+    __slots__ = (
+        "enabled",
+        "targets",
+        "probability_threshold",
+        "trust_telegram_language",
+        "min_text_length",
+    )
+
+    def __init__(
+        self,
+        targets: dict[str, list[str]],
+        enabled: bool = True,
+        probability_threshold: float = 0.1,
+        trust_telegram_language: bool = True,
+        min_text_length: int = None,
+    ):
+        # targets: destination language -> languages not translated to it
+        self.targets = targets
+        self.enabled = enabled
+        self.probability_threshold = probability_threshold
+        self.trust_telegram_language = trust_telegram_language
+        self.min_text_length = min_text_length
+
+    @property
+    def destination_language(self) -> str:
+        return next(iter(self.targets))
+
+    def __repr__(self):
+        return f"GroupConfig({', '.join(f'{k}={getattr(self, k)}' for k in self.__slots__)})"
+
+    def updated(
+        self, data: dict, excluded_for: Callable[[str], list[str]]
+    ) -> "GroupConfig":
+        destination_languages = data.get("destination_languages")
+        if isinstance(destination_languages, str):
+            destination_languages = [destination_languages]
+        excluded_languages = data.get("excluded_languages", {})
+        targets = (
+            {
+                target: (
+                    excluded_languages[target] + [target]
+                    if target in excluded_languages
+                    else excluded_for(target)
+                )
+                for target in destination_languages
+            }
+            if destination_languages
+            else self.targets
+        )
+        return GroupConfig(
+            targets,
+            enabled=data.get("enabled", self.enabled),
+            probability_threshold=data.get(
+                "probability_threshold", self.probability_threshold
+            ),
+            trust_telegram_language=data.get(
+                "trust_telegram_language", self.trust_telegram_language
+            ),
+            min_text_length=data.get("min_text_length", self.min_text_length),
+        )
+
+
+class GroupConfigStore:
+    def __init__(
+        self,
+        defaults: GroupConfig,
+        excluded_for: Callable[[str], list[str]],
+        groups: dict[int, GroupConfig] = None,
+        restricted: bool = False,
+        storage_path: Path = None,
+        config_filename: str = None,
+    ):
+        self.defaults = defaults
+        self.excluded_for = excluded_for
+        self.env_groups = groups or {}
+        # when restricted, only configured groups are translated
+        self.restricted = restricted
+        self.storage_path = storage_path or Path(__file__).parent.parent.joinpath(
+            "storage"
+        )
+        self.config_path = self.storage_path / (config_filename or "groups.json")
+        self.configs: dict[int, GroupConfig] = dict(self.env_groups)
+        self.mtime: float | None = None
+
+    def get(self, chat_id: int) -> GroupConfig:
+        return self.configs.get(chat_id, self.defaults)
+
+    def is_allowed(self, chat_id: int) -> bool:
+        return not self.restricted or chat_id in self.configs
+
+    @property
+    def groups(self) -> list[int]:
+        return list(self.configs)
+
+    def _read(self) -> dict:
+        if not self.config_path.exists():
+            self.mtime = None
+            return {}
+        self.mtime = self.config_path.stat().st_mtime
+        with self.config_path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("groups", {})
+
+    def load(self) -> bool:
+        try:
+            data = self._read()
+            configs = dict(self.env_groups)
+            for chat_id, group_data in data.items():
+                chat_id = int(chat_id)
+                base = configs.get(chat_id, self.defaults)
+                configs[chat_id] = base.updated(group_data, self.excluded_for)
+            # replaced at once, so handlers never see a half loaded config
+            self.configs = configs
+            logger.info(f"Loaded configuration of {len(data)} groups")
+            logger.debug(f"{self.configs=}")
+            return True
+        except Exception as e:
+            logger.error(f"Error loading '{self.config_path.name}': {e}")
+            return False
+
+    async def reload(self) -> bool:
+        return await asyncio.to_thread(self.load)
+
+    def _is_modified(self) -> bool:
+        try:
+            mtime = self.config_path.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+        return mtime != self.mtime
+
+    async def watch(self, interval: float = 10):
+        while True:
+            await asyncio.sleep(interval)
+            if await asyncio.to_thread(self._is_modified):
+                await self.reload()
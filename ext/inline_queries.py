@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+inline_queries = metrics.counter("inline_queries_total", "Answered inline queries")
+
+
+class InlineResult:
+    __slots__ = ("dest", "src", "text")
+
+    def __init__(self, dest: str, src: str, text: str):
+        self.dest = dest
+        self.src = src
+        self.text = text
+
+    def __repr__(self):
+        return f"{self.src}->{self.dest}:{self.text}"
+
+
+class InlineQueries:
+    def __init__(
+        self,
+        translate: Callable[[str, str], Awaitable[str]],
+        detect: Callable[[str], Awaitable[str]],
+        languages: list[str],
+        debounce: float = 0.5,
+        max_languages: int = 3,
+        cache_size: int = 1000,
+        cache_ttl: float = 3600,
+        max_text_length: int = 256,
+    ):
+        self.translate = translate
+        self.detect = detect
+        self.languages = languages
+        self.debounce = debounce
+        self.max_languages = max_languages
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.max_text_length = max_text_length
+        # (text, languages) -> (results, created)
+        self.cache: OrderedDict[tuple[str, tuple[str, ...]], tuple[list, float]] = (
+            OrderedDict()
+        )
+        # user_id -> number of the latest query, older queries are not answered
+        self.latest: dict[int, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.debounced = 0
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "cached": len(self.cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "debounced": self.debounced,
+        }
+
+    def parse(self, query: str) -> tuple[str, list[str]]:
+        # "<lang> <text>" translates to one language, "<text>" to the defaults
+        parts = query.strip().split(maxsplit=1)
+        if len(parts) == 2 and len(parts[0]) == 2 and parts[0].islower():
+            return parts[1], [parts[0]]
+        return query.strip(), self.languages[: self.max_languages]
+
+    def _get(self, key) -> list[InlineResult] | None:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        results, created = entry
+        if self.cache_ttl and time.monotonic() - created > self.cache_ttl:
+            del self.cache[key]
+            return None
+        self.cache.move_to_end(key)
+        return results
+
+    def _set(self, key, results: list[InlineResult]) -> None:
+        self.cache[key] = (results, time.monotonic())
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    async def _translate(self, text: str, languages: list[str]) -> list[InlineResult]:
+        detect = asyncio.create_task(self.detect(text))
+        translations = await asyncio.gather(
+            *[self.translate(text, dest) for dest in languages],
+            return_exceptions=True,
+        )
+        src = await detect
+        results = []
+        for dest, translated in zip(languages, translations):
+            if isinstance(translated, BaseException):
+                logger.error(f"Inline translation to '{dest}' failed: {translated}")
+            elif dest != src:
+                results.append(InlineResult(dest, src, translated))
+        return results
+
+    async def resolve(self, user_id: int, query: str) -> list[InlineResult] | None:
+        # returns None when a newer query of the user replaced this one
+        text, languages = self.parse(query[: self.max_text_length])
+        if not text:
+            return []
+        key = (" ".join(text.split()), tuple(languages))
+        results = self._get(key)
+        if results is not None:
+            self.hits += 1
+            return results
+        number = self.latest.get(user_id, 0) + 1
+        self.latest[user_id] = number
+        # waits until the user stops typing
+        await asyncio.sleep(self.debounce)
+        if self.latest.get(user_id) != number:
+            self.debounced += 1
+            return None
+        self.latest.pop(user_id, None)
+        results = self._get(key)
+        if results is None:
+            self.misses += 1
+            results = await self._translate(text, languages)
+            if results:
+                self._set(key, results)
+        inline_queries.inc()
+        return results
@@ -1,12 +1,165 @@
 import asyncio
 import logging
+import unicodedata
 from base64 import b64decode
-
-from langdetect import detect_langs, DetectorFactory
+from collections import OrderedDict
+from concurrent.futures import Executor
 
 logger = logging.getLogger("bot." + __name__)
 
 
+class DetectedLanguage:
+    __slots__ = ("lang", "prob")
+
+    def __init__(self, lang: str, prob: float):
+        self.lang = lang
+        self.prob = prob
+
+    def __repr__(self):
+        return f"{self.lang}:{self.prob}"
+
+
+class LangDetectBackend:
+    name = "langdetect"
+
+    def __init__(self, seed: int = 27):
+        self.seed = seed
+
+    def warmup(self) -> None:
+        # also used as initializer of detection worker processes,
+        # loads the language profiles before the first message needs them
+        from langdetect import DetectorFactory
+        from langdetect.detector_factory import init_factory
+
+        DetectorFactory.seed = self.seed
+        init_factory()
+
+    def detect(self, text: str) -> list[DetectedLanguage]:
+        from langdetect import detect_langs, DetectorFactory
+
+        DetectorFactory.seed = self.seed
+        return [DetectedLanguage(x.lang, x.prob) for x in detect_langs(text)]
+
+
+class ScriptDetectBackend:
+    name = "script"
+    # letters that identify a language inside the Cyrillic script, letters of
+    # Russian are common to many alphabets (bg, mn, ky) and left to langdetect
+    cyrillic_markers = {
+        "uk": set("іїєґ"),
+    }
+    # Cyrillic alphabets of the languages known to langdetect, a text with
+    # letters outside the alphabet is not in that language
+    cyrillic_alphabets = {
+        "uk": set("абвгґдеєжзиіїйклмнопрстуфхцчшщьюя"),
+        "ru": set("абвгдеёжзийклмнопрстуфхцчшщъыьэюя"),
+        "be": set("абвгґдеёжзійклмнопрстуўфхцчшыьэюя"),
+        "bg": set("абвгдежзийклмнопрстуфхцчшщъьюя"),
+        "mk": set("абвгдѓежзѕијклљмнњопрстќуфхцчџш"),
+        "sr": set("абвгдђежзијклљмнњопрстћуфхцчџш"),
+    }
+    # scripts that are used by a single language
+    unique_scripts = {
+        "GREEK": "el",
+        "HEBREW": "he",
+        "GEORGIAN": "ka",
+        "ARMENIAN": "hy",
+        "THAI": "th",
+        "HANGUL": "ko",
+        "HIRAGANA": "ja",
+        "KATAKANA": "ja",
+    }
+
+    # scripts of the other languages known to langdetect
+    language_scripts = {
+        **{lang: "CYRILLIC" for lang in ("uk", "ru", "be", "bg", "mk", "sr")},
+        **{lang: "ARABIC" for lang in ("ar", "fa", "ur")},
+        **{lang: "DEVANAGARI" for lang in ("hi", "mr", "ne")},
+        **{lang: "CJK" for lang in ("zh-cn", "zh-tw")},
+        "bn": "BENGALI",
+        "gu": "GUJARATI",
+        "kn": "KANNADA",
+        "ml": "MALAYALAM",
+        "pa": "GURMUKHI",
+        "ta": "TAMIL",
+        "te": "TELUGU",
+        **{
+            lang: "LATIN"
+            for lang in (
+                "af ca cs cy da de en es et fi fr hr hu id it lt lv nl no pl pt "
+                "ro sk sl so sq sv sw tl tr vi"
+            ).split()
+        },
+    }
+
+    def __init__(self, min_letters: int = 3, min_ratio: float = 0.9):
+        self.min_letters = min_letters
+        self.min_ratio = min_ratio
+
+    def warmup(self) -> None:
+        pass
+
+    @staticmethod
+    def script_of(char: str) -> str:
+        try:
+            return unicodedata.name(char).split(" ", 1)[0]
+        except ValueError:
+            return ""
+
+    def script_of_language(self, lang: str) -> str | None:
+        if lang == "ja":
+            # mixes kanji and kana, its dominant script varies
+            return None
+        for script, script_lang in self.unique_scripts.items():
+            if script_lang == lang:
+                return script
+        return self.language_scripts.get(lang)
+
+    def has_foreign_letters(self, text: str, lang: str) -> bool:
+        alphabet = self.cyrillic_alphabets.get(lang)
+        if alphabet is None:
+            return False
+        return any(
+            char not in alphabet and self.script_of(char) == "CYRILLIC"
+            for char in text.lower()
+            if char.isalpha()
+        )
+
+    def dominant_script(self, text: str) -> str | None:
+        if not text:
+            return None
+        scripts = {}
+        letters = 0
+        for char in text:
+            if char.isalpha():
+                letters += 1
+                script = self.script_of(char)
+                scripts[script] = scripts.get(script, 0) + 1
+        if letters < self.min_letters:
+            return None
+        script, count = max(scripts.items(), key=lambda x: x[1])
+        if count / letters < self.min_ratio:
+            return None
+        return script
+
+    def detect(self, text: str) -> list[DetectedLanguage]:
+        script = self.dominant_script(text)
+        if script is None:
+            return []
+        if script in self.unique_scripts:
+            return [DetectedLanguage(self.unique_scripts[script], 1.0)]
+        if script == "CYRILLIC":
+            chars = set(text.lower())
+            found = [
+                lang
+                for lang, markers in self.cyrillic_markers.items()
+                if chars & markers and not self.has_foreign_letters(text, lang)
+            ]
+            if len(found) == 1:
+                return [DetectedLanguage(found[0], 1.0)]
+        return []
+
+
 class LanguageDetection:
     languages_map = {
         b64decode("=uNC"[::-1].swapcase().encode()).decode(): "404",
@@ -17,11 +170,26 @@ class LanguageDetection:
         destination_language: str,
         excluded_languages: list[str],
         probability_threshold: float = 0.1,
+        backend=None,
+        pre_filter=None,
+        cache_size: int = 4096,
+        executor: Executor = None,
     ):
         self.destination_language = destination_language
         self.excluded_languages = excluded_languages
         self.probability_threshold = probability_threshold
-        DetectorFactory.seed = 27
+        self.backend = backend or LangDetectBackend()
+        self.pre_filter = (
+            pre_filter if pre_filter is not None else ScriptDetectBackend()
+        )
+        self.scripts = (
+            self.pre_filter
+            if isinstance(self.pre_filter, ScriptDetectBackend)
+            else ScriptDetectBackend()
+        )
+        self.cache_size = cache_size
+        self.cache: OrderedDict[str, list[DetectedLanguage]] = OrderedDict()
+        self.executor = executor
 
     def is_excluded_language(self, language):
         return language in self.excluded_languages
@@ -30,22 +198,96 @@ class LanguageDetection:
     def map_lang(cls, lang):
         return cls.languages_map.get(lang, lang)
 
-    def _detect_language(self, text):
-        # detected_language = detect(text)
-        detected_languages = detect_langs(text)
+    def warmup(self) -> None:
+        try:
+            self.backend.warmup()
+            if self.pre_filter:
+                self.pre_filter.warmup()
+            logger.debug(f"Language detection backend '{self.backend.name}' is ready")
+        except Exception as e:
+            logger.error(e)
+
+    def select_language(
+        self,
+        detected_languages: list[DetectedLanguage],
+        destination_language: str = None,
+        probability_threshold: float = None,
+    ) -> str:
+        destination_language = destination_language or self.destination_language
+        if probability_threshold is None:
+            probability_threshold = self.probability_threshold
         detected_language = (
             detected_languages[0].lang if len(detected_languages) > 0 else "?"
         )
         for language in detected_languages:
             if (
-                language.lang == self.destination_language
-                and language.prob >= self.probability_threshold
+                language.lang == destination_language
+                and language.prob >= probability_threshold
             ):
                 detected_language = language.lang
                 break
-        # print(f"{detected_language=}")
+        return detected_language
+
+    def select_targets(
+        self,
+        detected_languages: list[DetectedLanguage],
+        targets: dict[str, list[str]],
+        probability_threshold: float = None,
+    ) -> dict[str, str]:
+        # targets: destination language -> languages not translated to it,
+        # result: destination language -> detected source language
+        result = {}
+        for destination_language, excluded_languages in targets.items():
+            detected_language = self.select_language(
+                detected_languages, destination_language, probability_threshold
+            )
+            if detected_language not in excluded_languages:
+                result[destination_language] = detected_language
+        return result
+
+    def _detect_language(self, text):
+        detected_languages = self.backend.detect(text)
+        detected_language = self.select_language(detected_languages)
         logger.debug(f"{detected_language=}, {detected_languages=}")
         return detected_language
 
-    async def detect_language(self, text):
-        return await asyncio.to_thread(self._detect_language, text)
+    def _remember(self, text, detected_languages: list[DetectedLanguage]) -> None:
+        if not self.cache_size:
+            return
+        self.cache[text] = detected_languages
+        self.cache.move_to_end(text)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def check_script(self, text, lang: str) -> bool | None:
+        # cheap check by the alphabet whether the text can be in the language,
+        # None when it can't tell (too few letters, mixed or unknown script)
+        script = self.scripts.dominant_script(text)
+        expected = self.scripts.script_of_language(lang)
+        if script is None or expected is None:
+            return None
+        if script != expected or self.scripts.has_foreign_letters(text, lang):
+            return False
+        detected = self.scripts.detect(text)
+        return not detected or detected[0].lang == lang
+
+    async def detect_languages(self, text) -> list[DetectedLanguage]:
+        detected_languages = self.cache.get(text)
+        if detected_languages is not None:
+            self.cache.move_to_end(text)
+            return detected_languages
+        detected_languages = self.pre_filter.detect(text) if self.pre_filter else []
+        if detected_languages:
+            logger.debug(f"pre_filter={detected_languages}")
+        else:
+            # the backend is picklable, so the executor can be a process pool
+            detected_languages = await asyncio.get_running_loop().run_in_executor(
+                self.executor, self.backend.detect, text
+            )
+            logger.debug(f"{detected_languages=}")
+        self._remember(text, detected_languages)
+        return detected_languages
+
+    async def detect_language(self, text, destination_language: str = None):
+        detected_languages = await self.detect_languages(text)
+        return self.select_language(detected_languages, destination_language)
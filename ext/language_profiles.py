@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+language_profile_hits = metrics.counter(
+    "language_profile_hits_total", "Detections skipped thanks to a sender profile"
+)
+
+
+class LanguageProfile:
+    __slots__ = ("lang", "confidence", "observations", "updated", "skipped")
+
+    def __init__(
+        self,
+        lang: str,
+        confidence: float = 0.0,
+        observations: int = 0,
+        updated: float = None,
+    ):
+        self.lang = lang
+        self.confidence = confidence
+        self.observations = observations
+        self.updated = updated or time.time()
+        self.skipped = 0
+
+    def __repr__(self):
+        return f"{self.lang}:{self.confidence:.2f}/{self.observations}"
+
+
+class LanguageProfiles:
+    def __init__(
+        self,
+        storage_path: Path = None,
+        profiles_filename: str = None,
+        max_entries: int = 50000,
+        min_confidence: float = 0.9,
+        min_observations: int = 5,
+        sample_every: int = 10,
+        half_life: float = 7 * 24 * 3600,
+        alpha: float = 0.3,
+    ):
+        self.storage_path = storage_path or Path(__file__).parent.parent.joinpath(
+            "storage"
+        )
+        self.profiles_path = self.storage_path / (
+            profiles_filename or ".profiles.sqlite"
+        )
+        self.max_entries = max_entries
+        self.min_confidence = min_confidence
+        self.min_observations = min_observations
+        # every n-th message of a known sender is still detected
+        self.sample_every = sample_every
+        self.half_life = half_life
+        self.alpha = alpha
+        # (chat_id, sender_id) -> profile
+        self.profiles: OrderedDict[tuple[int, int], LanguageProfile] = OrderedDict()
+        self.dirty: set[tuple[int, int]] = set()
+        self.hits = 0
+        self.misses = 0
+        self.resets = 0
+        self.db_locker = threading.Lock()
+        self.db: sqlite3.Connection | None = None
+
+    def __len__(self):
+        return len(self.profiles)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "profiles": len(self.profiles),
+            "hits": self.hits,
+            "misses": self.misses,
+            "resets": self.resets,
+        }
+
+    def confidence(self, profile: LanguageProfile) -> float:
+        # confidence fades while the sender is silent
+        if not self.half_life:
+            return profile.confidence
+        age = max(0.0, time.time() - profile.updated)
+        return profile.confidence * 0.5 ** (age / self.half_life)
+
+    def predict(self, chat_id: int, sender_id: int) -> str | None:
+        profile = self.profiles.get((chat_id, sender_id))
+        if (
+            profile is None
+            or profile.observations < self.min_observations
+            or self.confidence(profile) < self.min_confidence
+        ):
+            self.misses += 1
+            return None
+        profile.skipped += 1
+        if self.sample_every and profile.skipped >= self.sample_every:
+            profile.skipped = 0
+            self.misses += 1
+            return None
+        self.hits += 1
+        language_profile_hits.inc()
+        return profile.lang
+
+    def observe(self, chat_id: int, sender_id: int, lang: str, prob: float) -> None:
+        key = (chat_id, sender_id)
+        profile = self.profiles.get(key)
+        if profile is None:
+            profile = self.profiles[key] = LanguageProfile(lang)
+        confidence = self.confidence(profile)
+        if profile.lang == lang:
+            profile.confidence = confidence + self.alpha * prob * (1 - confidence)
+        else:
+            profile.confidence = confidence * (1 - self.alpha * prob)
+            if profile.confidence < self.alpha * prob:
+                # another language dominates now
+                profile.lang = lang
+                profile.confidence = self.alpha * prob
+                profile.observations = 0
+        profile.observations += 1
+        profile.updated = time.time()
+        self.profiles.move_to_end(key)
+        self.dirty.add(key)
+        while len(self.profiles) > self.max_entries:
+            old_key, _ = self.profiles.popitem(last=False)
+            self.dirty.add(old_key)
+
+    def reset(self, chat_id: int, sender_id: int) -> None:
+        # a cheap check disagrees with the profile, detect until confident again
+        profile = self.profiles.get((chat_id, sender_id))
+        if profile is not None:
+            self.resets += 1
+            profile.confidence = 0.0
+            profile.observations = 0
+            self.dirty.add((chat_id, sender_id))
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.db = sqlite3.connect(self.profiles_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                "chat_id INTEGER NOT NULL, sender_id INTEGER NOT NULL, "
+                "lang TEXT NOT NULL, confidence REAL NOT NULL, "
+                "observations INTEGER NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (chat_id, sender_id))"
+            )
+            self.db.commit()
+        return self.db
+
+    def _store(self, rows: list[tuple], removed: list[tuple[int, int]]) -> None:
+        with self.db_locker:
+            db = self._connect()
+            db.executemany(
+                "INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            db.executemany(
+                "DELETE FROM profiles WHERE chat_id = ? AND sender_id = ?", removed
+            )
+            db.commit()
+
+    def _take_dirty(self) -> tuple[list[tuple], list[tuple[int, int]]]:
+        rows, removed = [], []
+        for key in self.dirty:
+            profile = self.profiles.get(key)
+            if profile is None:
+                removed.append(key)
+            else:
+                rows.append(
+                    (
+                        *key,
+                        profile.lang,
+                        profile.confidence,
+                        profile.observations,
+                        profile.updated,
+                    )
+                )
+        self.dirty = set()
+        return rows, removed
+
+    async def save(self) -> None:
+        if not self.dirty:
+            return
+        rows, removed = self._take_dirty()
+        try:
+            await asyncio.to_thread(self._store, rows, removed)
+            logger.debug(f"Saved {len(rows)} language profiles")
+        except Exception as e:
+            logger.error(f"Error during language profiles save: {e}")
+
+    async def autosave(self, interval: float = 60):
+        while True:
+            await asyncio.sleep(interval)
+            await self.save()
+
+    def _load(self) -> list[tuple] | None:
+        try:
+            with self.db_locker:
+                db = self._connect()
+                return db.execute(
+                    "SELECT chat_id, sender_id, lang, confidence, observations, "
+                    "updated FROM profiles ORDER BY updated DESC LIMIT ?",
+                    (self.max_entries,),
+                ).fetchall()
+        except Exception as e:
+            logger.error(e)
+
+    def _merge(self, rows: list[tuple] | None) -> None:
+        if rows is None:
+            return
+        profiles = OrderedDict(
+            ((chat_id, sender_id), LanguageProfile(*values))
+            for chat_id, sender_id, *values in reversed(rows)
+        )
+        profiles.update(self.profiles)
+        while len(profiles) > self.max_entries:
+            old_key, _ = profiles.popitem(last=False)
+            self.dirty.add(old_key)
+        self.profiles = profiles
+        logger.debug(f"Loaded language profiles: {len(self.profiles)} entries")
+
+    def load(self) -> None:
+        self._merge(self._load())
+
+    async def load_async(self) -> None:
+        # observations made during the read win over the stored profiles
+        self._merge(await asyncio.to_thread(self._load))
+
+    def close(self) -> None:
+        try:
+            self._store(*self._take_dirty())
+        except Exception as e:
+            logger.error(f"Error during language profiles save: {e}")
+        with self.db_locker:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
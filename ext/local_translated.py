@@ -1,13 +1,24 @@
 import asyncio
+import json
 import logging
+import os
+import re
 from base64 import b64decode
+from pathlib import Path
 
 logger = logging.getLogger("bot." + __name__)
 
 
 class LocalTranslated:
 
-    def __init__(self, translator, dest_language: str, src_language: str = "en"):
+    def __init__(
+        self,
+        translator,
+        dest_language: str,
+        src_language: str = "en",
+        catalog: list[str] = None,
+        storage_path: Path = None,
+    ):
         self.locker = asyncio.Lock()
         self.translator = translator
         self.dest_language = dest_language
@@ -16,6 +27,105 @@ class LocalTranslated:
             b64decode("=uNC"[::-1].swapcase().encode()).decode(): dest_language,
         }
         self.t_cache = {}
+        self.catalog: list[str] = list(dict.fromkeys(catalog or []))
+        self.locales_path = storage_path / "locales" if storage_path else None
+        self.warmups: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _locale_path(self, dest_language: str) -> Path | None:
+        if not self.locales_path or not re.fullmatch(r"[\w-]+", dest_language):
+            return None
+        return self.locales_path / f"{dest_language}.json"
+
+    def _load(self) -> dict[str, dict]:
+        locales = {}
+        if not self.locales_path or not self.locales_path.exists():
+            return locales
+        for path in self.locales_path.glob("*.json"):
+            try:
+                with path.open("r", encoding="utf-8") as f:
+                    locales[path.stem] = json.load(f)
+            except Exception as e:
+                logger.error(e)
+        return locales
+
+    def _merge(self, locales: dict[str, dict]) -> None:
+        for dest_language, translations in locales.items():
+            self.t_cache.setdefault(dest_language, {}).update(translations)
+            for input_text in translations:
+                if input_text not in self.catalog:
+                    self.catalog.append(input_text)
+        logger.debug(f"Loaded UI translations: {list(self.t_cache)}")
+
+    def load(self) -> None:
+        self._merge(self._load())
+
+    async def load_async(self) -> None:
+        # files are read in a thread, the cache is only changed on the loop
+        self._merge(await asyncio.to_thread(self._load))
+
+    def _save(self, dest_language: str, translations: dict) -> None:
+        path = self._locale_path(dest_language)
+        if not path:
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump(translations, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    async def save(self, dest_language: str):
+        try:
+            translations = dict(self.t_cache.get(dest_language, {}))
+            await asyncio.to_thread(self._save, dest_language, translations)
+        except Exception as e:
+            logger.error(f"Error during save: {e}")
+
+    async def _translate_batch(self, texts: list[str], dest_language: str) -> list:
+        try:
+            return await self.translator.translate(
+                texts, dest=dest_language, src=self.src_language
+            )
+        except Exception as e:
+            logger.warning(f"Batch translation of UI strings failed: {e}")
+        return await asyncio.gather(
+            *[
+                self.translator.translate(
+                    text, dest=dest_language, src=self.src_language
+                )
+                for text in texts
+            ],
+            return_exceptions=True,
+        )
+
+    async def _warmup(self, dest_language: str):
+        cached = self.t_cache.get(dest_language, {})
+        missing = [text for text in self.catalog if text not in cached]
+        if not missing:
+            return
+        results = await self._translate_batch(missing, dest_language)
+        async with self.locker:
+            translations = self.t_cache.setdefault(dest_language, {})
+            for input_text, r in zip(missing, results):
+                if r and not isinstance(r, Exception):
+                    translations[input_text] = r.text
+        logger.debug(f"Translated {len(missing)} UI strings to '{dest_language}'")
+        await self.save(dest_language)
+
+    async def warmup(self, dest_language: str = None):
+        dest_language = dest_language or self.dest_language
+        if dest_language == self.src_language:
+            return
+        task = self.warmups.get(dest_language)
+        if task is None:
+            task = asyncio.create_task(self._warmup(dest_language))
+            self.warmups[dest_language] = task
+        try:
+            await asyncio.shield(task)
+        except Exception as e:
+            self.warmups.pop(dest_language, None)
+            logger.error(e)
 
     async def gettext(
         self, input_text, dest_language: str = None, src_language: str = None
@@ -29,9 +139,20 @@ class LocalTranslated:
         if dest_language == src_language:
             return input_text
         if input_text in self.t_cache.get(dest_language, {}):
+            self.hits += 1
             return self.t_cache[dest_language][input_text]
+        self.misses += 1
+        warmup = self.warmups.get(dest_language)
+        if src_language == self.src_language and (warmup is None or not warmup.done()):
+            await self.warmup(dest_language)
+            if input_text in self.t_cache.get(dest_language, {}):
+                return self.t_cache[dest_language][input_text]
         r = await self.translator.translate(input_text, dest=dest_language)
         if r:
             async with self.locker:
                 self.t_cache.setdefault(dest_language, {})[input_text] = r.text
+            if src_language == self.src_language:
+                if input_text not in self.catalog:
+                    self.catalog.append(input_text)
+                await self.save(dest_language)
             return r.text
@@ -0,0 +1,54 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+class DeduplicateFilter(logging.Filter):
+    def __init__(self, interval: float = 60, level: int = logging.WARNING):
+        super().__init__()
+        self.interval = interval
+        self.level = level
+        # (logger, level, message) -> (first logged, suppressed count)
+        self.seen: dict[tuple[str, int, str], tuple[float, int]] = {}
+        self.locker = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level or not self.interval:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self.locker:
+            logged, suppressed = self.seen.get(key, (0.0, 0))
+            if now - logged < self.interval:
+                # the same error is logged at most once per interval
+                self.seen[key] = (logged, suppressed + 1)
+                return False
+            self.seen[key] = (now, 0)
+            if len(self.seen) > 1000:
+                self.seen = {
+                    k: v for k, v in self.seen.items() if now - v[0] < self.interval
+                }
+        if suppressed:
+            record.msg = f"{record.msg} (repeated {suppressed} times)"
+        return True
+
+
+def setup_logging(
+    format: str, level: int = logging.INFO, dedup_interval: float = 60
+) -> QueueListener:
+    # handlers write from a background thread, the event loop only enqueues
+    records = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(format))
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    queue_handler = QueueHandler(records)
+    queue_handler.addFilter(DeduplicateFilter(dedup_interval))
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -0,0 +1,59 @@
+import logging
+import re
+from collections import Counter
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class MessageFilter:
+    url_pattern = re.compile(r"(?:https?://|www\.|tg://)\S+", re.IGNORECASE)
+    mention_pattern = re.compile(r"(?:^|(?<=\s))[@#/]\w+")
+
+    def __init__(
+        self,
+        min_length: int = 3,
+        min_words: int = 1,
+        min_letters_ratio: float = 0.3,
+    ):
+        self.min_length = min_length
+        self.min_words = min_words
+        self.min_letters_ratio = min_letters_ratio
+        self.filtered = Counter()
+        self.passed = 0
+
+    def strip(self, text: str) -> str:
+        text = self.url_pattern.sub(" ", text)
+        text = self.mention_pattern.sub(" ", text)
+        return " ".join(text.split())
+
+    def _classify(self, text: str | None, min_length: int = None) -> str | None:
+        if not text or not text.strip():
+            return "empty"
+        stripped = self.strip(text)
+        if not stripped:
+            return "links"
+        letters = sum(1 for char in stripped if char.isalpha())
+        if not letters:
+            digits = sum(1 for char in stripped if char.isdigit())
+            return "numbers" if digits else "symbols"
+        if letters < (self.min_length if min_length is None else min_length):
+            return "too_short"
+        if len(stripped.split()) < self.min_words:
+            return "too_few_words"
+        non_space = sum(1 for char in stripped if not char.isspace())
+        if letters / non_space < self.min_letters_ratio:
+            return "low_letters_ratio"
+        return None
+
+    def classify(self, text: str | None, min_length: int = None) -> str | None:
+        rule = self._classify(text, min_length)
+        if rule:
+            self.filtered[rule] += 1
+            logger.debug(f"Message filtered by rule '{rule}'")
+        else:
+            self.passed += 1
+        return rule
+
+    @property
+    def stats(self) -> dict:
+        return {"passed": self.passed, **self.filtered}
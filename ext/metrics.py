@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable
+
+logger = logging.getLogger("bot." + __name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, registry: "Metrics", name: str, description: str = ""):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, value: float = 1, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def total(self) -> float:
+        return sum(self.values.values())
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{format_labels(k)} {v}" for k, v in self.values.items()]
+
+    def summary(self):
+        if len(self.values) == 1 and () in self.values:
+            return self.values[()]
+        return {",".join(v for _, v in k): n for k, n in self.values.items()}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        registry: "Metrics",
+        name: str,
+        description: str = "",
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        # labels -> [bucket counts..., +Inf count, sum]
+        self.values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        if not self.registry.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        data = self.values.get(key)
+        if data is None:
+            data = self.values[key] = [0] * (len(self.buckets) + 2)
+        data[bisect_left(self.buckets, value)] += 1
+        data[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        if not self.registry.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = []
+        for key, data in self.values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), data[:-1]):
+                cumulative += count
+                labels = format_labels((*key, ("le", str(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(key)} {data[-1]}")
+            lines.append(f"{self.name}_count{format_labels(key)} {cumulative}")
+        return lines
+
+    def summary(self):
+        result = {}
+        for key, data in self.values.items():
+            count = sum(data[:-1])
+            name = ",".join(v for _, v in key) or "all"
+            result[name] = {
+                "count": count,
+                "avg": round(data[-1] / count, 4) if count else 0.0,
+            }
+        return result
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(
+        self,
+        registry: "Metrics",
+        name: str,
+        description: str = "",
+        callback: Callable[[], float | dict] = None,
+    ):
+        self.registry = registry
+        self.name = name
+        self.description = description
+        self.callback = callback
+
+    def collect(self) -> dict[tuple, float]:
+        try:
+            value = self.callback()
+        except Exception as e:
+            logger.error(f"Gauge '{self.name}' failed: {e}")
+            return {}
+        if isinstance(value, dict):
+            return {(("key", str(k)),): v for k, v in value.items()}
+        return {(): value}
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{format_labels(k)} {v}" for k, v in self.collect().items()]
+
+    def summary(self):
+        values = self.collect()
+        if () in values:
+            return values[()]
+        return {k[0][1]: v for k, v in values.items()}
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False, prefix: str = "bot_"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.metrics: dict[str, Counter | Histogram | Gauge] = {}
+
+    def _get(self, metric_class, name: str, description: str, **options):
+        full_name = self.prefix + name
+        metric = self.metrics.get(full_name)
+        if metric is None:
+            metric = metric_class(self, full_name, description, **options)
+            self.metrics[full_name] = metric
+        return metric
+
+    def counter(self, name: str, description: str = "") -> Counter:
+        return self._get(Counter, name, description)
+
+    def histogram(
+        self, name: str, description: str = "", buckets=DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._get(Histogram, name, description, buckets=buckets)
+
+    def gauge(self, name: str, description: str = "", callback=None) -> Gauge:
+        gauge = self._get(Gauge, name, description)
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            if metric.description:
+                lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> dict:
+        return {
+            metric.name.removeprefix(self.prefix): metric.summary()
+            for metric in self.metrics.values()
+        }
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 9090):
+        from aiohttp import web
+
+        async def handle_metrics(request):
+            return web.Response(
+                text=self.render(), content_type="text/plain", charset="utf-8"
+            )
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Metrics are available on http://{host}:{port}/metrics")
+        return runner
+
+    async def log_summary(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"Metrics: {self.summary()}")
+
+
+metrics = Metrics()
@@ -0,0 +1,270 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from enum import IntEnum
+
+from telethon.errors import FloodWaitError
+
+from ext.metrics import metrics
+from ext.resilience import TokenBucket
+
+logger = logging.getLogger("bot." + __name__)
+
+outbox_sent = metrics.counter("outbox_sent_total", "Messages sent by the outbox")
+outbox_merged = metrics.counter(
+    "outbox_merged_total", "Translation replies merged into another message"
+)
+outbox_flood_waits = metrics.counter(
+    "outbox_flood_waits_total", "FloodWait errors returned by Telegram"
+)
+outbox_failed = metrics.counter(
+    "outbox_failed_total", "Messages not sent after all retries"
+)
+
+
+class Priority(IntEnum):
+    COMMAND = 0
+    TRANSLATION = 1
+    BACKLOG = 2
+
+
+class OutgoingMessage:
+    __slots__ = (
+        "priority",
+        "entity",
+        "text",
+        "reply_to",
+        "edit_id",
+        "mergeable",
+        "future",
+        "enqueued",
+    )
+
+    def __init__(
+        self,
+        priority: Priority,
+        entity,
+        text: str,
+        reply_to: int = None,
+        edit_id: int = None,
+        mergeable: bool = False,
+    ):
+        self.priority = priority
+        self.entity = entity
+        self.text = text
+        self.reply_to = reply_to
+        self.edit_id = edit_id
+        self.mergeable = mergeable
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+
+
+class Outbox:
+    def __init__(
+        self,
+        client,
+        global_rate: float = 30,
+        chat_rate: float = 1,
+        group_rate: float = 20 / 60,
+        group_burst: float = 3,
+        retries: int = 3,
+        max_flood_wait: float = 300,
+        merge: bool = False,
+        max_length: int = 4096,
+    ):
+        # defaults follow Telegram limits of bots: 30 messages per second,
+        # 1 message per second in a chat, 20 messages per minute in a group
+        self.client = client
+        self.global_limit = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.retries = retries
+        self.max_flood_wait = max_flood_wait
+        self.merge = merge
+        self.max_length = max_length
+        self.counter = itertools.count()
+        self.queues: dict[int, list[tuple[int, int, OutgoingMessage]]] = {}
+        self.limits: dict[int, TokenBucket] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.sent = 0
+        self.merged = 0
+        self.flood_waits = 0
+        self.failed = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "chats": len(self.queues),
+            "queued": self.queued,
+            "sent": self.sent,
+            "merged": self.merged,
+            "flood_waits": self.flood_waits,
+            "failed": self.failed,
+        }
+
+    def _get_limit(self, chat_id: int) -> TokenBucket:
+        limit = self.limits.get(chat_id)
+        if limit is None:
+            # negative ids are groups and channels
+            limit = self.limits[chat_id] = (
+                TokenBucket(self.group_rate, self.group_burst)
+                if chat_id < 0
+                else TokenBucket(self.chat_rate)
+            )
+        return limit
+
+    async def _put(self, chat_id: int, message: OutgoingMessage, wait: bool = True):
+        queue = self.queues.setdefault(chat_id, [])
+        heapq.heappush(queue, (message.priority, next(self.counter), message))
+        if chat_id not in self.workers:
+            self.workers[chat_id] = asyncio.create_task(self._worker(chat_id))
+        if not wait:
+            # failures are logged by the worker
+            message.future.add_done_callback(
+                lambda future: future.cancelled() or future.exception()
+            )
+            return None
+        return await message.future
+
+    async def send_message(
+        self,
+        chat_id: int,
+        text: str,
+        reply_to: int = None,
+        priority: Priority = Priority.COMMAND,
+        mergeable: bool = False,
+        entity=None,
+        wait: bool = True,
+    ):
+        message = OutgoingMessage(
+            priority,
+            entity if entity is not None else chat_id,
+            text,
+            reply_to=reply_to,
+            mergeable=mergeable,
+        )
+        return await self._put(chat_id, message, wait)
+
+    async def reply(
+        self,
+        event,
+        text: str,
+        priority: Priority = Priority.COMMAND,
+        mergeable: bool = False,
+        wait: bool = True,
+    ):
+        return await self.send_message(
+            event.chat_id,
+            text,
+            reply_to=event.id,
+            priority=priority,
+            mergeable=mergeable,
+            entity=await event.get_input_chat(),
+            wait=wait,
+        )
+
+    async def edit_message(
+        self,
+        chat_id: int,
+        message_id: int,
+        text: str,
+        priority: Priority = Priority.TRANSLATION,
+    ):
+        message = OutgoingMessage(priority, chat_id, text, edit_id=message_id)
+        return await self._put(chat_id, message)
+
+    def _next(self, chat_id: int) -> tuple[OutgoingMessage, list[OutgoingMessage]]:
+        queue = self.queues[chat_id]
+        _, _, message = heapq.heappop(queue)
+        if not (self.merge and message.mergeable):
+            return message, [message]
+        # pending translation replies are sent as one message
+        merged = [message]
+        length = len(message.text)
+        for item in sorted(queue):
+            other = item[2]
+            if not other.mergeable or length + len(other.text) + 2 > self.max_length:
+                break
+            merged.append(other)
+            length += len(other.text) + 2
+            queue.remove(item)
+        if len(merged) == 1:
+            return message, merged
+        heapq.heapify(queue)
+        self.merged += len(merged) - 1
+        outbox_merged.inc(len(merged) - 1)
+        last = merged[-1]
+        combined = OutgoingMessage(
+            last.priority,
+            last.entity,
+            "\n\n".join(item.text for item in merged),
+            reply_to=last.reply_to,
+        )
+        return combined, merged
+
+    async def _send(self, message: OutgoingMessage):
+        if message.edit_id is not None:
+            return await self.client.edit_message(
+                message.entity, message.edit_id, message.text
+            )
+        return await self.client.send_message(
+            message.entity, message.text, reply_to=message.reply_to
+        )
+
+    async def _deliver(self, chat_id: int, message: OutgoingMessage):
+        attempt = 0
+        while True:
+            await self.global_limit.acquire()
+            try:
+                return await self._send(message)
+            except FloodWaitError as e:
+                self.flood_waits += 1
+                outbox_flood_waits.inc()
+                if e.seconds > self.max_flood_wait:
+                    raise
+                logger.warning(f"Flood wait of {e.seconds}s in chat {chat_id}")
+                # the whole chat queue waits, other chats continue
+                await asyncio.sleep(e.seconds)
+            except (ConnectionError, asyncio.TimeoutError):
+                attempt += 1
+                if attempt > self.retries:
+                    raise
+                await asyncio.sleep(2**attempt)
+
+    async def _worker(self, chat_id: int):
+        queue = self.queues[chat_id]
+        limit = self._get_limit(chat_id)
+        try:
+            while queue:
+                await limit.acquire()
+                message, messages = self._next(chat_id)
+                try:
+                    result = await self._deliver(chat_id, message)
+                    self.sent += 1
+                    outbox_sent.inc()
+                    for item in messages:
+                        if not item.future.done():
+                            item.future.set_result(result)
+                except Exception as e:
+                    self.failed += len(messages)
+                    outbox_failed.inc(len(messages))
+                    logger.error(f"Message to chat {chat_id} not sent: {e}")
+                    for item in messages:
+                        if not item.future.done():
+                            item.future.set_exception(e)
+        finally:
+            self.queues.pop(chat_id, None)
+            self.workers.pop(chat_id, None)
+
+    def close(self) -> None:
+        if self.queued:
+            logger.warning(f"{self.queued} outgoing messages were not sent")
+        for task in self.workers.values():
+            task.cancel()
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class ReplyIndex:
+    def __init__(
+        self,
+        storage_path: Path = None,
+        index_filename: str = None,
+        max_entries: int = 10000,
+        persistent: bool = True,
+    ):
+        self.storage_path = storage_path or Path(__file__).parent.parent.joinpath(
+            "storage"
+        )
+        self.index_path = self.storage_path / (index_filename or ".replies.sqlite")
+        self.max_entries = max_entries
+        self.persistent = persistent
+        # (chat_id, message_id) -> (reply_id, text digest)
+        self.entries: OrderedDict[tuple[int, int], tuple[int, str]] = OrderedDict()
+        self.db_locker = threading.Lock()
+        self.db: sqlite3.Connection | None = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    @staticmethod
+    def digest(text: str | None) -> str:
+        normalized = " ".join(text.split()) if text else ""
+        return hashlib.blake2b(normalized.encode(), digest_size=8).hexdigest()
+
+    def get(self, chat_id: int, message_id: int) -> tuple[int, str] | None:
+        return self.entries.get((chat_id, message_id))
+
+    def is_changed(self, chat_id: int, message_id: int, text: str | None) -> bool:
+        entry = self.get(chat_id, message_id)
+        return entry is None or entry[1] != self.digest(text)
+
+    async def set(self, chat_id: int, message_id: int, reply_id: int, text: str):
+        key = (chat_id, message_id)
+        value = (reply_id, self.digest(text))
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        if not self.persistent:
+            return
+        try:
+            await asyncio.to_thread(self._store, key, value)
+        except Exception as e:
+            logger.error(f"Error during reply index store: {e}")
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.db = sqlite3.connect(self.index_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS replies ("
+                "chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, "
+                "reply_id INTEGER NOT NULL, digest TEXT NOT NULL, "
+                "PRIMARY KEY (chat_id, message_id))"
+            )
+            self.db.commit()
+        return self.db
+
+    def _store(self, key: tuple[int, int], value: tuple[int, str]) -> None:
+        with self.db_locker:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO replies VALUES (?, ?, ?, ?)", (*key, *value)
+            )
+            db.commit()
+
+    def _load(self) -> list[tuple] | None:
+        try:
+            with self.db_locker:
+                db = self._connect()
+                db.execute(
+                    "DELETE FROM replies WHERE rowid NOT IN "
+                    "(SELECT rowid FROM replies ORDER BY rowid DESC LIMIT ?)",
+                    (self.max_entries,),
+                )
+                db.commit()
+                return db.execute(
+                    "SELECT chat_id, message_id, reply_id, digest FROM replies "
+                    "ORDER BY rowid"
+                ).fetchall()
+        except Exception as e:
+            logger.error(e)
+
+    def _merge(self, rows: list[tuple] | None) -> None:
+        if rows is None:
+            return
+        entries = OrderedDict(
+            ((chat_id, message_id), (reply_id, digest))
+            for chat_id, message_id, reply_id, digest in rows
+        )
+        entries.update(self.entries)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self.entries = entries
+        logger.debug(f"Loaded reply index: {len(self.entries)} entries")
+
+    def load(self) -> None:
+        if self.persistent:
+            self._merge(self._load())
+
+    async def load_async(self) -> None:
+        # replies sent while the index is read stay on top of the stored ones
+        if self.persistent:
+            self._merge(await asyncio.to_thread(self._load))
+
+    def close(self) -> None:
+        with self.db_locker:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import random
+import time
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+translation_retries = metrics.counter(
+    "translation_retries_total", "Retried upstream translations"
+)
+translation_hedges = metrics.counter(
+    "translation_hedges_total", "Hedged upstream translations"
+)
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.locker = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, tokens: float = 1) -> None:
+        if not self.rate:
+            return
+        async with self.locker:
+            self._refill()
+            # a request larger than the bucket leaves it in debt
+            needed = min(tokens, self.capacity)
+            if self.tokens < needed:
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, recovery_time: float = 30):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.recovery_time:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.probing:
+            # let a single request through to check whether upstream recovered
+            self.probing = True
+            return True
+        return False
+
+    def success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Translation service recovered, circuit closed")
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def cancel(self) -> None:
+        # a cancelled probe tells nothing about upstream, the next one may go
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(
+                    f"Translation service failed {self.failures} times, "
+                    f"circuit opened for {self.recovery_time}s"
+                )
+            self.opened_at = time.monotonic()
+
+
+class ResilientTranslator:
+    def __init__(
+        self,
+        translator,
+        rate: float = 5,
+        burst: float = None,
+        retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8,
+        failure_threshold: int = 5,
+        recovery_time: float = 30,
+        hedge_after: float = 0,
+    ):
+        self.translator = translator
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, recovery_time)
+        self.hedge_after = hedge_after
+
+    async def _call(self, text, dest: str, src: str):
+        # every text of a list counts against the rate
+        await self.bucket.acquire(len(text) if isinstance(text, list) else 1)
+        return await self.translator.translate(text, dest=dest, src=src)
+
+    async def _hedged_call(self, text, dest: str, src: str):
+        if not self.hedge_after:
+            return await self._call(text, dest, src)
+        first = asyncio.create_task(self._call(text, dest, src))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+        translation_hedges.inc()
+        tasks = {first, asyncio.create_task(self._call(text, dest, src))}
+        try:
+            while tasks:
+                done, tasks = await asyncio.wait(
+                    tasks, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            # both attempts failed
+            raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def translate(self, text, dest: str = "en", src: str = "auto"):
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError("Translation service is unavailable")
+            try:
+                result = await self._hedged_call(text, dest, src)
+                self.breaker.success()
+                return result
+            except asyncio.CancelledError:
+                self.breaker.cancel()
+                raise
+            except Exception as e:
+                self.breaker.failure()
+                if attempt >= self.retries:
+                    raise
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2**attempt)
+                )
+                logger.debug(f"Translation failed: {e}, retry in {delay:.2f}s")
+                translation_retries.inc()
+                await asyncio.sleep(delay)
+
+    async def close(self):
+        await self.translator.close()
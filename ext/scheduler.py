@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+scheduler_wait_seconds = metrics.histogram(
+    "scheduler_wait_seconds", "Time a message waits in the queue for translation"
+)
+
+
+class Job:
+    __slots__ = ("prepare", "deliver", "enqueued")
+
+    def __init__(
+        self,
+        prepare: Callable[[], Awaitable[Any]],
+        deliver: Callable[[Any], Awaitable[Any]],
+    ):
+        self.prepare = prepare
+        self.deliver = deliver
+        self.enqueued = time.monotonic()
+
+
+class ChatScheduler:
+    policies = ("drop_oldest", "drop_newest")
+
+    def __init__(
+        self,
+        max_concurrency: int = 32,
+        per_chat_concurrency: int = 1,
+        max_queue: int = 100,
+        policy: str = "drop_oldest",
+    ):
+        if policy not in self.policies:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        self.max_concurrency = max_concurrency
+        self.per_chat_concurrency = per_chat_concurrency
+        self.max_queue = max_queue
+        self.policy = policy
+        self.global_limit = asyncio.Semaphore(max_concurrency)
+        self.queues: dict[int, deque[Job]] = {}
+        self.workers: dict[int, asyncio.Task] = {}
+        self.running = 0
+        self.processed = 0
+        self.dropped = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self.queues.values())
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "chats": len(self.queues),
+            "queued": self.queued,
+            "running": self.running,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "wait_avg": (
+                round(self.wait_total / self.processed, 4) if self.processed else 0.0
+            ),
+            "wait_max": round(self.wait_max, 4),
+        }
+
+    def queue_depths(self) -> dict[int, int]:
+        # a chat is listed while its worker runs, the queue may already be empty
+        return {chat_id: len(queue) for chat_id, queue in self.queues.items()}
+
+    def submit(
+        self,
+        chat_id: int,
+        prepare: Callable[[], Awaitable[Any]],
+        deliver: Callable[[Any], Awaitable[Any]],
+    ) -> bool:
+        queue = self.queues.setdefault(chat_id, deque())
+        if len(queue) >= self.max_queue:
+            self.dropped += 1
+            if self.policy == "drop_newest":
+                logger.warning(f"Queue of chat {chat_id} is full, message skipped")
+                return False
+            queue.popleft()
+            logger.warning(f"Queue of chat {chat_id} is full, oldest message skipped")
+        queue.append(Job(prepare, deliver))
+        if chat_id not in self.workers:
+            self.workers[chat_id] = asyncio.create_task(self._worker(chat_id))
+        return True
+
+    async def _prepare(self, job: Job, chat_limit: asyncio.Semaphore):
+        try:
+            async with self.global_limit:
+                wait = time.monotonic() - job.enqueued
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+                scheduler_wait_seconds.observe(wait)
+                self.running += 1
+                try:
+                    return await job.prepare()
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        except Exception as e:
+            logger.error(e)
+        finally:
+            chat_limit.release()
+
+    async def _worker(self, chat_id: int):
+        queue = self.queues[chat_id]
+        chat_limit = asyncio.Semaphore(self.per_chat_concurrency)
+        # jobs are prepared concurrently, but delivered in the order of arrival
+        ordered: deque[tuple[asyncio.Task, Job]] = deque()
+        try:
+            while queue or ordered:
+                while queue and not chat_limit.locked():
+                    job = queue.popleft()
+                    await chat_limit.acquire()
+                    task = asyncio.create_task(self._prepare(job, chat_limit))
+                    ordered.append((task, job))
+                task, job = ordered.popleft()
+                result = await task
+                if result is None:
+                    continue
+                try:
+                    await job.deliver(result)
+                except Exception as e:
+                    logger.error(e)
+        finally:
+            self.queues.pop(chat_id, None)
+            self.workers.pop(chat_id, None)
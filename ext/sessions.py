@@ -1,10 +1,19 @@
 import asyncio
+import json
 import logging
+import os
 import pickle
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
 from enum import StrEnum
 from pathlib import Path
 
+from ext.metrics import metrics
+
 logger = logging.getLogger("bot." + __name__)
+sessions_save_seconds = metrics.histogram(
+    "sessions_save_seconds", "Duration of writing sessions to storage"
+)
 
 
 class Category(StrEnum):
@@ -12,16 +21,307 @@ class Category(StrEnum):
     INFORMED = "informed"
 
 
+def empty_sessions() -> dict:
+    return {category: {} for category in Category}
+
+
+def apply_change(sessions: dict, op: str, category: Category, group_id: int, value):
+    if op == "add":
+        sessions[category].setdefault(group_id, set()).add(value)
+    elif op == "remove":
+        sessions[category].get(group_id, set()).discard(value)
+
+
+class JournalBackend:
+    name = "journal"
+
+    def __init__(
+        self,
+        storage_path: Path,
+        sessions_filename: str = None,
+        flush_interval: float = 1.0,
+        compact_threshold: int = 1000,
+        fsync: bool = True,
+    ):
+        self.sessions_path = storage_path / (sessions_filename or ".sessions.pickle")
+        self.journal_path = self.sessions_path.with_suffix(".journal")
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+        self.fsync = fsync
+        self.journal_records = 0
+        self.pending: list[str] = []
+        self.flush_task: asyncio.Task | None = None
+        self.locker = asyncio.Lock()
+        self.snapshot = None
+
+    def append(self, op: str, category: Category, group_id: int, value) -> None:
+        self.pending.append(
+            json.dumps({"op": op, "c": str(category), "g": group_id, "v": value})
+        )
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # records appended during a write or compaction wait for the next round
+        while self.pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def _write_journal(self, records: list[str]) -> None:
+        with self.journal_path.open("a", encoding="utf-8") as f:
+            f.write("".join(f"{record}\n" for record in records))
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+
+    async def flush(self):
+        async with self.locker:
+            records, self.pending = self.pending, []
+            if not records:
+                return
+            try:
+                with sessions_save_seconds.time(backend=self.name):
+                    await asyncio.to_thread(self._write_journal, records)
+                self.journal_records += len(records)
+            except Exception as e:
+                self.pending = records + self.pending
+                logger.error(f"Error during journal write: {e}")
+                return
+        if self.journal_records >= self.compact_threshold and self.snapshot:
+            await self.save(self.snapshot())
+
+    def _save(self, sessions: dict) -> bool:
+        try:
+            tmp_path = self.sessions_path.with_suffix(".tmp")
+            with tmp_path.open("wb") as f:
+                pickle.dump(sessions, f)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, self.sessions_path)
+            self.journal_path.unlink(missing_ok=True)
+            return True
+        except Exception as e:
+            logger.error(e)
+            return False
+
+    async def save(self, sessions: dict):
+        async with self.locker:
+            # pending records are already applied and become part of snapshot
+            records, self.pending = self.pending, []
+            # Run the blocking I/O operation in a separate thread
+            with sessions_save_seconds.time(backend=self.name):
+                saved = await asyncio.to_thread(self._save, sessions)
+            if saved:
+                self.journal_records = 0
+            else:
+                self.pending = records + self.pending
+
+    def _replay(self, sessions: dict, record: str) -> bool:
+        try:
+            data = json.loads(record)
+            apply_change(
+                sessions, data["op"], Category(data["c"]), data["g"], data["v"]
+            )
+            return True
+        except Exception as e:
+            logger.warning(f"Skipped broken journal record: {e}")
+            return False
+
+    def load(self) -> dict:
+        sessions = empty_sessions()
+        if self.sessions_path.exists():
+            try:
+                with self.sessions_path.open("rb") as f:
+                    sessions.update(pickle.load(f))
+            except Exception as e:
+                logger.error(e)
+        if self.journal_path.exists():
+            try:
+                with self.journal_path.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip() and self._replay(sessions, line):
+                            self.journal_records += 1
+                logger.debug(f"Replayed {self.journal_records} journal records")
+            except Exception as e:
+                logger.error(e)
+        return sessions
+
+    def close(self) -> None:
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+        if self.pending:
+            records, self.pending = self.pending, []
+            try:
+                self._write_journal(records)
+            except Exception as e:
+                logger.error(e)
+
+
+class SQLiteBackend:
+    name = "sqlite"
+
+    def __init__(
+        self,
+        storage_path: Path,
+        database_filename: str = None,
+        pickle_filename: str = None,
+    ):
+        self.database_path = storage_path / (database_filename or ".sessions.sqlite")
+        self.pickle_path = storage_path / (pickle_filename or ".sessions.pickle")
+        # a single dedicated thread keeps the connection and the order of writes
+        self.executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="sessions-db"
+        )
+        self.db: sqlite3.Connection | None = None
+        self.writes: set[asyncio.Future] = set()
+        self.snapshot = None
+        self.data_version = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.db = sqlite3.connect(self.database_path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            for category in Category:
+                self.db.execute(
+                    f"CREATE TABLE IF NOT EXISTS {category} ("
+                    "group_id INTEGER NOT NULL, user_id INTEGER NOT NULL, "
+                    "PRIMARY KEY (group_id, user_id))"
+                )
+            self.db.commit()
+        return self.db
+
+    def _write(self, op: str, category: Category, group_id: int, value) -> None:
+        with sessions_save_seconds.time(backend=self.name):
+            self._execute(op, category, group_id, value)
+
+    def _execute(self, op: str, category: Category, group_id: int, value) -> None:
+        db = self._connect()
+        if op == "add":
+            db.execute(
+                f"INSERT OR IGNORE INTO {category} VALUES (?, ?)", (group_id, value)
+            )
+        elif op == "remove":
+            db.execute(
+                f"DELETE FROM {category} WHERE group_id = ? AND user_id = ?",
+                (group_id, value),
+            )
+        db.commit()
+
+    def append(self, op: str, category: Category, group_id: int, value) -> None:
+        future = asyncio.get_running_loop().run_in_executor(
+            self.executor, self._write, op, category, group_id, value
+        )
+        self.writes.add(future)
+        future.add_done_callback(self._write_done)
+
+    def _write_done(self, future: asyncio.Future) -> None:
+        self.writes.discard(future)
+        if not future.cancelled() and future.exception():
+            logger.error(f"Error during sessions write: {future.exception()}")
+
+    async def flush(self):
+        if self.writes:
+            await asyncio.wait(list(self.writes))
+
+    def _data_version(self) -> int:
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    async def is_changed(self) -> bool:
+        # data_version changes only when another connection commits
+        version = await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._data_version
+        )
+        changed, self.data_version = self.data_version != version, version
+        return changed
+
+    def _save(self, sessions: dict) -> None:
+        db = self._connect()
+        for category in Category:
+            db.executemany(
+                f"INSERT OR IGNORE INTO {category} VALUES (?, ?)",
+                [
+                    (group_id, value)
+                    for group_id, values in sessions.get(category, {}).items()
+                    for value in values
+                ],
+            )
+        db.commit()
+
+    async def save(self, sessions: dict):
+        await self.flush()
+        await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._save, sessions
+        )
+
+    def _import_pickle(self) -> None:
+        journal = JournalBackend(self.pickle_path.parent, self.pickle_path.name)
+        files = [journal.sessions_path, journal.journal_path]
+        if not any(path.exists() for path in files):
+            return
+        self._save(journal.load())
+        for path in files:
+            try:
+                path.rename(path.with_name(f"{path.name}.imported"))
+            except FileNotFoundError:
+                # missing or already imported by another process
+                pass
+        logger.info(f"Imported sessions from '{self.pickle_path.name}'")
+
+    def _load(self) -> dict:
+        db = self._connect()
+        self._import_pickle()
+        sessions = empty_sessions()
+        for category in Category:
+            for group_id, user_id in db.execute(
+                f"SELECT group_id, user_id FROM {category}"
+            ):
+                sessions[category].setdefault(group_id, set()).add(user_id)
+        self.data_version = self._data_version()
+        return sessions
+
+    async def reload(self) -> dict:
+        return await asyncio.get_running_loop().run_in_executor(
+            self.executor, self._load
+        )
+
+    def load(self) -> dict:
+        return self.executor.submit(self._load).result()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
 class Sessions:
-    def __init__(self, storage_path: Path = None, sessions_filename: str = None):
-        self.sessions = {Category.EXCLUDED_SENDERS: {}, Category.INFORMED: {}}
-        self.sessions_filename = sessions_filename or ".sessions.pickle"
+    def __init__(
+        self,
+        storage_path: Path = None,
+        sessions_filename: str = None,
+        backend=None,
+        **backend_options,
+    ):
+        self.sessions = empty_sessions()
         self.storage_path = storage_path or Path(__file__).parent.parent.joinpath(
             "storage"
         )
         self.storage_path.mkdir(parents=True, exist_ok=True)
-        self.sessions_path = self.storage_path / self.sessions_filename
-        self.locker = asyncio.Lock()
+        if backend is None or backend == JournalBackend.name:
+            backend = JournalBackend(
+                self.storage_path, sessions_filename, **backend_options
+            )
+        elif backend == SQLiteBackend.name:
+            backend = SQLiteBackend(self.storage_path, **backend_options)
+        elif isinstance(backend, str):
+            raise ValueError(f"Unknown sessions backend: {backend}")
+        self.backend = backend
+        self.backend.snapshot = self._snapshot
+        self.changes = 0
+        # set once stored sessions are loaded, changes wait for it
+        self.loaded = asyncio.Event()
 
     @property
     def excluded_senders(self):
@@ -37,40 +337,83 @@ class Sessions:
     def __str__(self):
         return str(self.sessions)
 
+    async def wait_loaded(self) -> None:
+        if not self.loaded.is_set():
+            await self.loaded.wait()
+
     async def add(self, category: Category, group_id: int, value):
-        async with self.locker:
-            self.sessions[category].setdefault(group_id, set()).add(value)
-            await self.save()
+        await self.wait_loaded()
+        self.changes += 1
+        apply_change(self.sessions, "add", category, group_id, value)
+        self.backend.append("add", category, group_id, value)
 
     async def remove(self, category: Category, group_id: int, value):
-        async with self.locker:
-            self.sessions[category][group_id].discard(value)
-            await self.save()
+        await self.wait_loaded()
+        self.changes += 1
+        apply_change(self.sessions, "remove", category, group_id, value)
+        self.backend.append("remove", category, group_id, value)
 
     def is_exists(self, category: Category, group_id: int, value):
         return value in self.sessions.get(category, {}).get(group_id, set())
 
-    def _save(self):
-        try:
-            with self.sessions_path.open("wb") as f:
-                pickle.dump(self.sessions, f)
-        except Exception as e:
-            logger.error(e)
+    def _snapshot(self) -> dict:
+        return {
+            category: {group_id: set(values) for group_id, values in groups.items()}
+            for category, groups in self.sessions.items()
+        }
+
+    async def flush(self):
+        await self.backend.flush()
 
     async def save(self):
         try:
-            # Run the blocking I/O operation in a separate thread
-            await asyncio.to_thread(self._save)
+            await self.backend.save(self._snapshot())
         except Exception as e:
             logger.error(f"Error during save: {e}")
 
-    def load(self, storage_file: str = None) -> None:
+    def _load(self) -> dict | None:
         if not self.storage_path.exists():
             return None
-        if self.sessions_path.exists():
+        try:
+            sessions = self.backend.load()
+            logger.debug(f"Loaded ({self.backend.name}): {sessions}")
+            return sessions
+        except Exception as e:
+            logger.error(e)
+
+    def load(self, storage_file: str = None) -> None:
+        sessions = self._load()
+        if sessions is not None:
+            self.sessions = sessions
+        self.loaded.set()
+
+    async def load_async(self) -> None:
+        # reads the storage in a thread, so events are received meanwhile
+        sessions = await asyncio.to_thread(self._load)
+        if sessions is not None:
+            self.sessions = sessions
+        self.loaded.set()
+
+    async def watch(self, interval: float = 5):
+        # keeps the in-memory state in sync with other processes sharing storage
+        if not hasattr(self.backend, "is_changed"):
+            logger.warning(f"Sessions backend '{self.backend.name}' can't be shared")
+            return
+        while True:
+            await asyncio.sleep(interval)
             try:
-                with self.sessions_path.open("rb") as f:
-                    self.sessions = pickle.load(f)
-                    logger.debug(f"Loaded: {self.sessions}")
+                if await self.backend.is_changed():
+                    changes = self.changes
+                    await self.backend.flush()
+                    sessions = await self.backend.reload()
+                    if changes != self.changes:
+                        # changed locally meanwhile, reload on the next check
+                        self.backend.data_version = None
+                        continue
+                    self.sessions = sessions
+                    logger.debug(f"Reloaded sessions: {self.sessions}")
             except Exception as e:
                 logger.error(e)
+
+    def close(self) -> None:
+        self.backend.close()
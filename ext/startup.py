@@ -0,0 +1,46 @@
+import asyncio
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        # stage name -> (offset from start, duration) in seconds
+        self.stages: dict[str, tuple[float, float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (
+                started - self.started,
+                time.perf_counter() - started,
+            )
+
+    def mark(self, name: str) -> None:
+        self.stages[name] = (time.perf_counter() - self.started, 0.0)
+
+    async def run(self, name: str, awaitable: Awaitable):
+        with self.stage(name):
+            try:
+                return await awaitable
+            except Exception as e:
+                logger.error(f"Startup stage '{name}' failed: {e}")
+
+    async def run_in_thread(self, name: str, func, *args):
+        return await self.run(name, asyncio.to_thread(func, *args))
+
+    def report(self) -> str:
+        return ", ".join(
+            f"{name} +{offset:.3f}s ({duration:.3f}s)"
+            for name, (offset, duration) in sorted(
+                self.stages.items(), key=lambda x: x[1]
+            )
+        )
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class TranslationBatcher:
+    def __init__(
+        self,
+        translator,
+        window: float = 0.05,
+        max_batch: int = 20,
+        batches: bool = True,
+    ):
+        self.translator = translator
+        self.window = window
+        self.max_batch = max_batch
+        # without list requests texts are sent at once, only identical ones shared
+        self.batches = batches
+        self.pending: dict[tuple[str, str], dict[str, asyncio.Future]] = {}
+        self.in_flight: dict[tuple[str, str, str], asyncio.Future] = {}
+        self.timers: dict[tuple[str, str], asyncio.TimerHandle] = {}
+        self.upstream_calls = 0
+        self.requests = 0
+
+    async def translate(self, text, dest: str = "en", src: str = "auto"):
+        if not isinstance(text, str):
+            return await self.translator.translate(text, dest=dest, src=src)
+        self.requests += 1
+        group = (src, dest)
+        future = self.in_flight.get((src, dest, text))
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[(src, dest, text)] = future
+            batch = self.pending.setdefault(group, {})
+            batch[text] = future
+            if len(batch) >= self.max_batch or not self.batches:
+                self._flush(group)
+            elif group not in self.timers:
+                self.timers[group] = asyncio.get_running_loop().call_later(
+                    self.window, self._flush, group
+                )
+        return await asyncio.shield(future)
+
+    def _flush(self, group: tuple[str, str]):
+        timer = self.timers.pop(group, None)
+        if timer:
+            timer.cancel()
+        batch = self.pending.pop(group, None)
+        if batch:
+            asyncio.create_task(self._send(group, batch))
+
+    async def _send(self, group: tuple[str, str], batch: dict[str, asyncio.Future]):
+        src, dest = group
+        texts = list(batch)
+        try:
+            self.upstream_calls += 1
+            if len(texts) == 1:
+                results = [
+                    await self.translator.translate(texts[0], dest=dest, src=src)
+                ]
+            else:
+                results = await self.translator.translate(texts, dest=dest, src=src)
+            if len(results) != len(texts):
+                raise ValueError(
+                    f"Batch size mismatch: sent {len(texts)}, got {len(results)}"
+                )
+            for text, result in zip(texts, results):
+                if not batch[text].done():
+                    batch[text].set_result(result)
+        except Exception as e:
+            logger.error(f"Batch translation failed: {e}")
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            for text in texts:
+                self.in_flight.pop((src, dest, text), None)
+            logger.debug(
+                f"Batch translated {len(texts)} texts to '{dest}', "
+                f"{self.upstream_calls=}, {self.requests=}"
+            )
+
+    async def close(self):
+        await self.translator.close()
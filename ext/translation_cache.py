@@ -0,0 +1,186 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from ext.metrics import metrics
+
+logger = logging.getLogger("bot." + __name__)
+translation_seconds = metrics.histogram(
+    "translation_seconds", "Upstream translation latency"
+)
+translation_errors = metrics.counter(
+    "translation_errors_total", "Failed upstream translations"
+)
+
+
+class TranslationCache:
+    def __init__(
+        self,
+        storage_path: Path = None,
+        cache_filename: str = None,
+        max_entries: int = 10000,
+        ttl: int = 7 * 24 * 3600,
+        max_text_length: int = 4096,
+    ):
+        self.storage_path = storage_path or Path(__file__).parent.parent.joinpath(
+            "storage"
+        )
+        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self.cache_filename = cache_filename or ".translations.sqlite"
+        self.cache_path = self.storage_path / self.cache_filename
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_text_length = max_text_length
+        self.entries: OrderedDict[tuple[str, str, str], tuple[str, float]] = (
+            OrderedDict()
+        )
+        self.hits = 0
+        self.misses = 0
+        self.db_locker = threading.Lock()
+        self.db: sqlite3.Connection | None = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join(text.split()) if text else ""
+
+    def make_key(self, text: str, dest: str, src: str = None) -> tuple[str, str, str]:
+        return self.normalize(text), src or "auto", dest
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 3) if total else 0.0,
+        }
+
+    def get(self, text: str, dest: str, src: str = None) -> str | None:
+        key = self.make_key(text, dest, src)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        translated, created = entry
+        if self.ttl and time.time() - created > self.ttl:
+            del self.entries[key]
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return translated
+
+    async def set(self, text: str, dest: str, translated: str, src: str = None):
+        key = self.make_key(text, dest, src)
+        if not key[0] or translated is None or len(key[0]) > self.max_text_length:
+            return
+        created = time.time()
+        self.entries[key] = (translated, created)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        try:
+            await asyncio.to_thread(self._store, key, translated, created)
+        except Exception as e:
+            logger.error(f"Error during cache store: {e}")
+
+    async def translate(self, translator, text: str, dest: str, src: str = None) -> str:
+        translated = self.get(text, dest, src)
+        if translated is not None:
+            return translated
+        options = {"dest": dest}
+        if src:
+            options["src"] = src
+        try:
+            with translation_seconds.time(dest=dest):
+                result = await translator.translate(text, **options)
+        except Exception:
+            translation_errors.inc(dest=dest)
+            raise
+        await self.set(text, dest, result.text, src)
+        return result.text
+
+    def _connect(self) -> sqlite3.Connection:
+        if self.db is None:
+            self.db = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                "text TEXT NOT NULL, src TEXT NOT NULL, dest TEXT NOT NULL, "
+                "translated TEXT NOT NULL, created REAL NOT NULL, "
+                "PRIMARY KEY (text, src, dest))"
+            )
+            self.db.execute(
+                "CREATE INDEX IF NOT EXISTS translations_created "
+                "ON translations (created)"
+            )
+            self.db.commit()
+        return self.db
+
+    def _store(self, key: tuple[str, str, str], translated: str, created: float):
+        with self.db_locker:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?)",
+                (*key, translated, created),
+            )
+            db.commit()
+
+    def _prune(self, db: sqlite3.Connection):
+        if self.ttl:
+            db.execute(
+                "DELETE FROM translations WHERE created < ?",
+                (time.time() - self.ttl,),
+            )
+        db.execute(
+            "DELETE FROM translations WHERE rowid NOT IN "
+            "(SELECT rowid FROM translations ORDER BY created DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        db.commit()
+
+    def _load(self) -> list[tuple] | None:
+        try:
+            with self.db_locker:
+                db = self._connect()
+                self._prune(db)
+                return db.execute(
+                    "SELECT text, src, dest, translated, created FROM translations "
+                    "ORDER BY created"
+                ).fetchall()
+        except Exception as e:
+            logger.error(e)
+
+    def _merge(self, rows: list[tuple] | None) -> None:
+        if rows is None:
+            return
+        entries = OrderedDict(
+            ((text, src, dest), (translated, created))
+            for text, src, dest, translated, created in rows
+        )
+        # translations cached since the start are newer than the stored ones
+        entries.update(self.entries)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self.entries = entries
+        logger.debug(f"Loaded translation cache: {len(self.entries)} entries")
+
+    def load(self) -> None:
+        self._merge(self._load())
+
+    async def load_async(self) -> None:
+        # only the database is read in a thread, entries change on the loop
+        self._merge(await asyncio.to_thread(self._load))
+
+    def close(self) -> None:
+        with self.db_locker:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import random
+
+logger = logging.getLogger("bot." + __name__)
+
+
+class Translated:
+    __slots__ = ("text", "src", "dest", "origin")
+
+    def __init__(self, text: str, src: str, dest: str, origin: str = None):
+        self.text = text
+        self.src = src
+        self.dest = dest
+        self.origin = origin
+
+    def __repr__(self):
+        return f"Translated(src={self.src}, dest={self.dest}, text={self.text})"
+
+
+class GoogleTranslator:
+    name = "google"
+    # googletrans sends a request per item of a list
+    batches = False
+
+    def __init__(self, **options):
+        self.options = options
+        self.translator = None
+
+    def _get_translator(self):
+        # googletrans is imported on the first translation, not at startup
+        if self.translator is None:
+            from googletrans import Translator
+
+            self.translator = Translator(**self.options)
+        return self.translator
+
+    async def translate(self, text, dest: str = "en", src: str = "auto"):
+        return await self._get_translator().translate(text, dest=dest, src=src)
+
+    async def close(self):
+        pass
+
+
+class LibreTranslator:
+    name = "libre"
+    batches = True
+
+    def __init__(
+        self,
+        url: str = "http://localhost:5000",
+        api_key: str = None,
+        timeout: float = 10,
+        max_connections: int = 20,
+    ):
+        self.url = url.rstrip("/") + "/translate"
+        self.api_key = api_key
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.session = None
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            import aiohttp
+
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.max_connections, keepalive_timeout=60
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+        return self.session
+
+    async def translate(self, text, dest: str = "en", src: str = "auto"):
+        payload = {"q": text, "source": src or "auto", "target": dest, "format": "text"}
+        if self.api_key:
+            payload["api_key"] = self.api_key
+        async with self._get_session().post(self.url, json=payload) as response:
+            data = await response.json(content_type=None)
+            if response.status != 200:
+                raise RuntimeError(
+                    f"LibreTranslate error {response.status}: {data.get('error')}"
+                )
+        translated = data["translatedText"]
+        detected = data.get("detectedLanguage")
+        if isinstance(text, list):
+            detected = detected or [None] * len(text)
+            return [
+                Translated(t, (d or {}).get("language", src), dest, o)
+                for t, d, o in zip(translated, detected, text)
+            ]
+        return Translated(translated, (detected or {}).get("language", src), dest, text)
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+
+class FakeTranslator:
+    name = "fake"
+    batches = True
+
+    def __init__(self, latency: float = 0, failure_rate: float = 0, seed: int = 27):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    def _translate(self, text: str, dest: str, src: str) -> Translated:
+        return Translated(f"[{dest}] {text}", src, dest, text)
+
+    async def translate(self, text, dest: str = "en", src: str = "auto"):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failure_rate and self.random.random() < self.failure_rate:
+            raise RuntimeError("Fake translation failure")
+        if isinstance(text, list):
+            return [self._translate(t, dest, src) for t in text]
+        return self._translate(text, dest, src)
+
+    async def close(self):
+        pass
+
+
+translators = {
+    GoogleTranslator.name: GoogleTranslator,
+    LibreTranslator.name: LibreTranslator,
+    FakeTranslator.name: FakeTranslator,
+}
+
+
+def create_translator(name: str = "google", **options):
+    try:
+        translator_class = translators[name]
+    except KeyError:
+        raise ValueError(f"Unknown translator backend: {name}")
+    logger.debug(f"Translator backend: {name}")
+    return translator_class(**options)
@@ -0,0 +1,327 @@
+"""Replay a corpus of synthetic Telegram events through the bot handlers.
+
+Runs offline: Telegram is replaced with an in-process stub client and the
+translator with the ``fake`` backend, so the numbers show the cost of the
+bot's own pipeline. Usage::
+
+    python scripts/benchmark.py --events 2000 --groups 5 --latency 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--corpus",
+        type=Path,
+        default=Path(__file__).with_name("benchmark_corpus.jsonl"),
+    )
+    parser.add_argument("--events", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--senders", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=0, help="events/s, 0 - no limit")
+    parser.add_argument("--latency", type=float, default=0.02, help="translator, s")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--reply-latency", type=float, default=0.0)
+    parser.add_argument("--memory-samples", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=27)
+    parser.add_argument("--json", action="store_true", help="print report as JSON")
+    return parser.parse_args()
+
+
+def setup_environment(args) -> None:
+    os.environ.setdefault("API_ID", "1")
+    os.environ.setdefault("API_HASH", "benchmark")
+    os.environ.setdefault("BOT_TOKEN", "benchmark")
+    os.environ.setdefault("GROUPS_ID", "")
+    os.environ.setdefault("STORAGE_PATH", tempfile.mkdtemp(prefix="bot-benchmark-"))
+    os.environ.setdefault("TRANSLATOR_BACKEND", "fake")
+    os.environ.setdefault("FAKE_TRANSLATOR_LATENCY", str(args.latency))
+    os.environ.setdefault("FAKE_TRANSLATOR_FAILURE_RATE", str(args.failure_rate))
+    os.environ.setdefault("TRANSLATOR_RATE", "0")
+    os.environ.setdefault("OUTBOX_GLOBAL_RATE", "0")
+    os.environ.setdefault("OUTBOX_CHAT_RATE", "0")
+    os.environ.setdefault("OUTBOX_GROUP_RATE_PER_MINUTE", "0")
+    os.environ.setdefault("USE_INTRO_MESSAGE", "False")
+
+
+class Stages:
+    def __init__(self):
+        self.timings: dict[str, list[float]] = defaultdict(list)
+
+    def wrap(self, stage: str, func):
+        if asyncio.iscoroutinefunction(func):
+
+            async def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.timings[stage].append(time.perf_counter() - start)
+
+        else:
+
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.timings[stage].append(time.perf_counter() - start)
+
+        return timed
+
+    def add(self, stage: str, value: float) -> None:
+        self.timings[stage].append(value)
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+class FakeClient:
+    def __init__(self, stages: "Stages", reply_latency: float = 0):
+        self.stages = stages
+        self.reply_latency = reply_latency
+        self.sent = 0
+        # id of a replied event -> time it was received
+        self.received: dict[int, float] = {}
+
+    async def send_message(self, entity, message, reply_to: int = None, **kwargs):
+        start = time.perf_counter()
+        if self.reply_latency:
+            await asyncio.sleep(self.reply_latency)
+        self.sent += 1
+        self.stages.add("reply", time.perf_counter() - start)
+        if (received := self.received.pop(reply_to, None)) is not None:
+            self.stages.add("end_to_end", time.perf_counter() - received)
+        return SimpleNamespace(id=self.sent, chat_id=entity, message=message)
+
+    async def edit_message(self, entity, message_id, text, **kwargs):
+        if self.reply_latency:
+            await asyncio.sleep(self.reply_latency)
+        return SimpleNamespace(id=message_id, chat_id=entity, message=text)
+
+    async def get_entity(self, entity):
+        return SimpleNamespace(id=entity, title=f"Group {entity}")
+
+    async def __call__(self, request):
+        return SimpleNamespace(participant=request)
+
+
+class FakeEvent:
+    last_id = 0
+
+    def __init__(self, record: dict, chat_id: int, sender_id: int, bench):
+        FakeEvent.last_id += 1
+        self.id = FakeEvent.last_id
+        self.bench = bench
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.is_group = True
+        self.sender = SimpleNamespace(lang_code=record.get("lang_code"))
+        self.pattern_match = None
+        self.created = time.perf_counter()
+        media = None
+        text = record.get("text", "")
+        if poll := record.get("poll"):
+            media = SimpleNamespace(
+                poll=SimpleNamespace(
+                    question=SimpleNamespace(text=poll["question"]),
+                    answers=[
+                        SimpleNamespace(text=SimpleNamespace(text=answer))
+                        for answer in poll["answers"]
+                    ],
+                )
+            )
+            text = ""
+        self.raw_text = text
+        self.message = SimpleNamespace(message=text, media=media)
+
+        bench.client.received[self.id] = self.created
+
+    async def get_input_chat(self):
+        return self.chat_id
+
+    async def reply(self, message, **kwargs):
+        return await self.bench.client.send_message(
+            self.chat_id, message, reply_to=self.id
+        )
+
+
+class Benchmark:
+    def __init__(self, args, bot):
+        self.args = args
+        self.bot = bot
+        self.stages = Stages()
+        self.client = FakeClient(self.stages, args.reply_latency)
+        self.random = random.Random(args.seed)
+        self.memory: list[tuple[int, int]] = []
+        self.handlers = self._collect_handlers()
+        self._instrument()
+
+    def _collect_handlers(self):
+        from telethon import events
+
+        handlers = [
+            (callback, builder.pattern)
+            for callback, builder in self.bot.client.list_event_handlers()
+            if isinstance(builder, events.NewMessage)
+        ]
+        handlers.append(
+            (self.bot.handler, events.NewMessage(pattern=r"^(?!/).*").pattern)
+        )
+        return handlers
+
+    def _instrument(self):
+        bot = self.bot
+        bot.client = self.client
+        bot.outbox.client = self.client
+        bot.__version__ = "benchmark"
+        bot.extract_text_from_message = self.stages.wrap(
+            "extract", bot.extract_text_from_message
+        )
+        bot.language_detection.detect_languages = self.stages.wrap(
+            "detect", bot.language_detection.detect_languages
+        )
+        bot.translation_cache.translate = self.stages.wrap(
+            "translate", bot.translation_cache.translate
+        )
+
+    def load_corpus(self) -> list[dict]:
+        with self.args.corpus.open("r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    async def dispatch(self, event: FakeEvent):
+        start = time.perf_counter()
+        for callback, pattern in self.handlers:
+            match = pattern(event.raw_text) if pattern else True
+            if not match:
+                continue
+            event.pattern_match = match if pattern else None
+            await callback(event)
+        self.stages.add("dispatch", time.perf_counter() - start)
+
+    async def drain(self):
+        if self.bot.aggregator:
+            self.bot.aggregator.flush_all()
+        while self.bot.scheduler.workers or self.bot.outbox.workers:
+            await asyncio.sleep(0.01)
+
+    async def run(self) -> dict:
+        corpus = self.load_corpus()
+        groups = [-1000000000000 - i for i in range(self.args.groups)]
+        sample_every = max(1, self.args.events // max(1, self.args.memory_samples))
+        tracemalloc.start()
+        await asyncio.to_thread(self.bot.language_detection.warmup)
+        start = time.perf_counter()
+        tasks = set()
+        for i in range(self.args.events):
+            event = FakeEvent(
+                self.random.choice(corpus),
+                self.random.choice(groups),
+                self.random.randint(1, self.args.senders),
+                self,
+            )
+            task = asyncio.create_task(self.dispatch(event))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            if self.args.rate:
+                await asyncio.sleep(1 / self.args.rate)
+            elif i % 100 == 0:
+                await asyncio.sleep(0)
+            if i % sample_every == 0:
+                self.memory.append((i, tracemalloc.get_traced_memory()[0]))
+        await asyncio.gather(*tasks)
+        await self.drain()
+        await self.bot.sessions.flush()
+        elapsed = time.perf_counter() - start
+        self.memory.append((self.args.events, tracemalloc.get_traced_memory()[0]))
+        tracemalloc.stop()
+        return self.report(elapsed)
+
+    def report(self, elapsed: float) -> dict:
+        return {
+            "events": self.args.events,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(self.args.events / elapsed, 1),
+            "replies": self.client.sent,
+            "stages": {
+                stage: {
+                    "count": len(values),
+                    "p50_ms": round(percentile(values, 50) * 1000, 3),
+                    "p95_ms": round(percentile(values, 95) * 1000, 3),
+                    "p99_ms": round(percentile(values, 99) * 1000, 3),
+                }
+                for stage, values in self.stages.timings.items()
+            },
+            "memory_kb": [(i, round(size / 1024)) for i, size in self.memory],
+            "translation_cache": self.bot.translation_cache.stats,
+            "message_filter": self.bot.message_filter.stats,
+            "scheduler": self.bot.scheduler.stats,
+            "outbox": self.bot.outbox.stats,
+            "language_profiles": (
+                self.bot.language_profiles.stats
+                if self.bot.language_profiles is not None
+                else None
+            ),
+        }
+
+
+def print_report(report: dict) -> None:
+    print(
+        f"events: {report['events']}, elapsed: {report['elapsed']}s, "
+        f"throughput: {report['throughput']} events/s, replies: {report['replies']}"
+    )
+    print(f"{'stage':<12}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, row in report["stages"].items():
+        print(
+            f"{stage:<12}{row['count']:>8}{row['p50_ms']:>10}"
+            f"{row['p95_ms']:>10}{row['p99_ms']:>10}"
+        )
+    print("memory (event, KiB):", report["memory_kb"])
+    for key in (
+        "translation_cache",
+        "message_filter",
+        "scheduler",
+        "outbox",
+        "language_profiles",
+    ):
+        print(f"{key}: {report[key]}")
+
+
+def main():
+    args = parse_args()
+    setup_environment(args)
+    import bot
+
+    bot.sessions.load()
+    report = asyncio.run(Benchmark(args, bot).run())
+    bot.sessions.close()
+    bot.translation_cache.close()
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+logging.basicConfig(
+    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s", level=logging.INFO
+)
+
+logger = logging.getLogger("supervisor")
+
+load_dotenv()
+
+workers_count = int(os.environ.get("WORKERS", os.cpu_count() or 1))
+restart_delay = float(os.environ.get("WORKER_RESTART_DELAY", 5))
+bot_path = Path(__file__).parent / "bot.py"
+stopping = False
+
+
+def start_worker(index: int) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        SHARD_COUNT=str(workers_count),
+        SHARD_INDEX=str(index),
+        # workers share users settings through one database
+        SESSIONS_BACKEND="sqlite",
+    )
+    logger.info(f"Starting worker {index + 1} of {workers_count}")
+    return subprocess.Popen([sys.executable, str(bot_path)], env=env)
+
+
+def stop(signum, frame):
+    global stopping
+    stopping = True
+
+
+def main():
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    workers = {index: start_worker(index) for index in range(workers_count)}
+    while not stopping:
+        time.sleep(1)
+        for index, worker in workers.items():
+            if worker.poll() is not None and not stopping:
+                logger.warning(
+                    f"Worker {index + 1} exited with code {worker.returncode}, "
+                    f"restarting in {restart_delay}s"
+                )
+                time.sleep(restart_delay)
+                workers[index] = start_worker(index)
+    logger.info("Stopping workers...")
+    for worker in workers.values():
+        if worker.poll() is None:
+            worker.send_signal(signal.SIGINT)
+    for worker in workers.values():
+        try:
+            worker.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            worker.kill()
+
+
+if __name__ == "__main__":
+    main()